@@ -0,0 +1,73 @@
+import os, time, logging, sqlite3, threading
+import metrics
+
+# Where finished games are kept once they leave memory; set ARCHIVE_PATH to an
+# empty string to evict them without keeping their results
+ARCHIVE_PATH = os.environ.get(
+    'ARCHIVE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.archive.sqlite3')
+)
+
+ARCHIVED = metrics.Counter('games_archived', 'Finished games written to the archive')
+ARCHIVE_WRITE_DURATION = metrics.Histogram(
+    'archive_write_duration_seconds', 'Time to write one batch of finished games to the archive')
+
+class Archive:
+    """Final results of finished games in a SQLite file, one row per game code
+
+    A row holds what /game/sync answers for a finished game: the layout, the
+    board as one signed byte per cell, the final version, the winner, the
+    last nextUpdateTime and the ETag the game had in memory, so clients that
+    already saw the end get a 304. Archiving a game under a code that is
+    already in the archive replaces the older row. The connection is shared
+    by the tick loop and request threads, so every call takes a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps reads from waiting on writes; NORMAL only syncs at checkpoints
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS games ('
+            ' gameCode TEXT PRIMARY KEY, layout TEXT NOT NULL, cells BLOB NOT NULL, version INTEGER NOT NULL,'
+            ' winner TEXT, nextUpdateTime REAL NOT NULL, etag TEXT NOT NULL, archivedAt REAL NOT NULL'
+            ') WITHOUT ROWID')
+        self._db.commit()
+
+    def store(self, rows):
+        """Write (gameCode, layout, cells, version, winner, nextUpdateTime, etag) rows in one transaction
+
+        Returns False, after logging why, if the write failed and nothing was stored.
+        """
+        start = time.perf_counter()
+        archivedAt = time.time()
+        try:
+            with self._lock, self._db:
+                self._db.executemany('INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                     [row + (archivedAt,) for row in rows])
+        except sqlite3.Error:
+            logging.exception('Could not archive %d finished games to %s', len(rows), self.path)
+            return False
+        ARCHIVED.inc(len(rows))
+        ARCHIVE_WRITE_DURATION.observe(time.perf_counter() - start)
+        return True
+
+    def load(self, gameCode):
+        """The archived row for a game code as a dict, or None"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT layout, cells, version, winner, nextUpdateTime, etag FROM games WHERE gameCode = ?',
+                (gameCode,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('layout', 'cells', 'version', 'winner', 'nextUpdateTime', 'etag'), row))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
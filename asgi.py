@@ -0,0 +1,247 @@
+import os, json, time, asyncio, logging, urllib.parse
+import socketio
+from broadcast import AsyncBroadcaster
+from journal import JOURNAL_DIR
+from archive import ARCHIVE_PATH
+from drain import DRAIN_PATH
+import games
+import metrics
+
+# Asyncio entry point: the HTTP routes, socket handlers, tick loop and broadcaster
+# all run on one event loop under an ASGI server instead of Flask threads.
+#
+#     uvicorn asgi:app --host 0.0.0.0 --port 5000
+#
+# Game state lives in memory, so run a single worker process.
+
+logging.basicConfig(level=logging.INFO)
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type, If-None-Match'),
+    (b'access-control-expose-headers', b'ETag')
+]
+
+def room_has_clients(room):
+    """Whether any socket is in a room, so we don't encode payloads nobody receives"""
+    return next(sio.manager.get_participants('/', room), None) is not None
+
+async def broadcast(event, payload, room):
+    """Emit an event to a room, recording how long the emit took"""
+    start = time.perf_counter()
+    await sio.emit(event, payload, to=room)
+    games.EMIT_DURATION.observe(time.perf_counter() - start, event)
+
+# Tick updates are sent from their own task so socket I/O doesn't hold up the loop
+broadcaster = AsyncBroadcaster(broadcast)
+
+async def synchronize(data, headers):
+    """Synchronize game state, answering 304 for an unchanged If-None-Match
+
+    With ?wait=<seconds> an unchanged request is held until the next tick or
+    move changes the game, or the wait runs out.
+    """
+    if_none_match = headers.get('if-none-match')
+    body, status, etag = games.synchronize(data, if_none_match)
+
+    wait = games.long_poll_timeout(data)
+    if status == 304 and wait:
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        wake = lambda: loop.call_soon_threadsafe(changed.set)
+        if games.watch_state(data.get('gameCode'), if_none_match, wake):
+            try:
+                await asyncio.wait_for(changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            games.unwatch_state(data.get('gameCode'), wake)
+        body, status, etag = games.synchronize(data, if_none_match)
+
+    extra = [] if etag is None else [(b'etag', etag.encode()), (b'cache-control', b'no-cache')]
+    return body, status, extra
+
+async def make_move(data, headers):
+    """Process a player move and broadcast its preview"""
+    body, status, messages = games.make_move(data, room_has_clients)
+    await broadcaster.deliver(messages)
+    return body, status
+
+def export_metrics(data, headers):
+    """Expose tick, request and socket metrics in the Prometheus text format"""
+    return metrics.render(), 200
+
+# (method, path) -> (handler, where its data comes from). Handlers take the
+# request data and lowercased headers and return (body, status) or
+# (body, status, extra headers); a None body sends no content and a bytes body
+# is sent as already-encoded JSON.
+ROUTES = {
+    ('GET', '/metrics'): (export_metrics, 'query'),
+    ('GET', '/game/active'): (lambda data, headers: games.count_active_games(), 'query'),
+    ('POST', '/game/create'): (lambda data, headers: games.create_game(data), 'json'),
+    ('GET', '/game/sync'): (synchronize, 'query'),
+    ('GET', '/game/legal-moves'): (lambda data, headers: games.legal_moves(data), 'query'),
+    ('POST', '/game/join'): (lambda data, headers: games.join_game(data), 'json'),
+    ('POST', '/game/move'): (make_move, 'json')
+}
+ROUTE_PATHS = {path for _, path in ROUTES}
+
+async def read_body(receive):
+    """Collect the full request body from the ASGI receive channel"""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def http_app(scope, receive, send):
+    """Minimal JSON router for the game HTTP API"""
+    start = time.perf_counter()
+    method, path = scope['method'], scope['path']
+    headers = list(CORS_HEADERS)
+
+    if method == 'OPTIONS':
+        # CORS preflight; labelled like other requests so arbitrary paths can't add metric series
+        route = path if path in ROUTE_PATHS else 'unmatched'
+        status, payload = 204, b''
+    elif (method, path) not in ROUTES:
+        route, status = 'unmatched', 404
+        payload = json.dumps({'error': 'Not found'}).encode()
+    else:
+        route = path
+        handler, source = ROUTES[(method, path)]
+        if source == 'json':
+            body = await read_body(receive)
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                data = None
+        else:
+            data = dict(urllib.parse.parse_qsl(scope['query_string'].decode()))
+
+        if not isinstance(data, dict):
+            result, status = {'error': 'Invalid JSON body'}, 400
+        else:
+            request_headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                               for name, value in scope['headers']}
+            try:
+                response = handler(data, request_headers)
+                if asyncio.iscoroutine(response):
+                    response = await response
+                result, status, *extra = response
+                headers.extend(extra[0] if extra else [])
+            except Exception:
+                logging.exception('Error handling %s %s', method, path)
+                result, status = {'error': 'Internal server error'}, 500
+
+        if result is None:
+            payload = b''
+        elif isinstance(result, bytes):
+            # Already-encoded JSON, e.g. a cached snapshot
+            payload = result
+            headers.append((b'content-type', b'application/json'))
+        elif isinstance(result, str):
+            payload = result.encode()
+            headers.append((b'content-type', metrics.CONTENT_TYPE.encode()))
+        else:
+            payload = json.dumps(result).encode()
+            headers.append((b'content-type', b'application/json'))
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': payload})
+    games.REQUEST_DURATION.observe(time.perf_counter() - start, route, method, status)
+
+@sio.event
+async def connect(sid, environ):
+    logging.info('Client connected')
+    games.SOCKET_CONNECTIONS.inc()
+
+@sio.event
+async def disconnect(sid, *args):
+    games.SOCKET_CONNECTIONS.dec()
+    games.leave_quickmatch(sid)
+
+@sio.on('join_game')
+async def handle_join_game(sid, data):
+    room, event, payload = games.join_socket(data)
+
+    # Join the socket room for this game and encoding
+    if room is not None:
+        await sio.enter_room(sid, room)
+    await sio.emit(event, payload, to=sid)
+
+@sio.on('request_snapshot')
+async def handle_request_snapshot(sid, data):
+    """Resend the full state to a client that missed a game_update delta"""
+    event, payload = games.snapshot_reply(data)
+    await sio.emit(event, payload, to=sid)
+
+@sio.on('quickmatch')
+async def handle_quickmatch(sid, data=None):
+    """Queue this socket for a game against the next player who asks"""
+    event, payload, messages = games.quickmatch(sid, data, room_has_clients)
+    await sio.emit(event, payload, to=sid)
+    await broadcaster.deliver(messages)
+
+@sio.on('cancel_quickmatch')
+async def handle_cancel_quickmatch(sid, data=None):
+    """Take this socket out of the quick-match queue"""
+    event, payload = games.cancel_quickmatch(sid)
+    await sio.emit(event, payload, to=sid)
+
+@sio.on('request_legal_moves')
+async def handle_request_legal_moves(sid, data):
+    """Send the cells each side can currently claim or defend"""
+    event, payload = games.legal_moves_reply(data)
+    await sio.emit(event, payload, to=sid)
+
+async def game_loop():
+    """Tick loop sleeping on the event loop until the next deadline instead of in a thread"""
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    games.scheduler.add_listener(lambda: loop.call_soon_threadsafe(wakeup.set))
+
+    while True:
+        # Sleep until the earliest tick or lobby expiry is due, or an earlier one is scheduled
+        deadline = games.scheduler.next_deadline()
+        timeout = None if deadline is None else max(0, deadline - time.time())
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+
+        # Resolve every due game, then hand all the results to the broadcaster at once
+        broadcaster.publish(games.run_due(time.time(), room_has_clients))
+
+# Background tasks, kept referenced so they aren't garbage collected
+tasks = []
+
+async def start_background_tasks():
+    if ARCHIVE_PATH:
+        games.open_archive(ARCHIVE_PATH)
+    if JOURNAL_DIR:
+        restored, replayed, seconds = games.open_journal(JOURNAL_DIR, DRAIN_PATH)
+        logging.info('Restored %d games from %d journal events in %.2fs', restored, replayed, seconds)
+    elif DRAIN_PATH:
+        games.open_drain(DRAIN_PATH)
+    tasks.append(asyncio.create_task(game_loop()))
+    tasks.append(asyncio.create_task(broadcaster.run()))
+
+def stop_background_tasks():
+    # Uvicorn runs this on SIGTERM once it has stopped accepting connections
+    if DRAIN_PATH:
+        written, seconds = games.drain_games(DRAIN_PATH)
+        logging.info('Drained %d games to %s in %.2fs', written, DRAIN_PATH, seconds)
+    games.close_journal()
+    games.close_archive()
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app, on_startup=start_background_tasks,
+                       on_shutdown=stop_background_tasks)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,74 @@
+import numpy as np
+
+# Move type codes used in the stacked move arrays
+NO_ACTION, CLAIM, DEFEND = 0, 1, 2
+
+def resolve_batch(games, adjacency, round_rng, defense_cap=2, neutralize_chance=0.5):
+    """Resolve the queued moves of many games at once
+
+    Applies the same rules as process_moves: the host move is resolved before
+    the player move, defends raise a cell's strength up to defense_cap, claims
+    neutralize each adjacent enemy cell at strength 1 with neutralize_chance,
+    and defends neutralize them when the defended cell is stronger. All games must share the layout whose padded neighbour index
+    array is passed as adjacency. Claim rolls come from round_rng(game), one
+    per strength-1 enemy neighbour in ascending cell order, host before
+    player, exactly as process_moves draws them, so both engines produce the
+    same boards. Returns the moves_made flag for each game.
+    """
+    size = adjacency.shape[0]
+    boards = np.zeros((len(games), size + 1), dtype=np.int8)
+    stacked = b''.join(game.board.cells for game in games)
+    boards[:, :size] = np.frombuffer(stacked, dtype=np.int8).reshape(len(games), size)
+    before = boards.copy()
+    moves_made = np.zeros(len(games), dtype=bool)
+    rngs = {}  # row -> that game's generator, once seeded for this round
+
+    for move_key, symbol in (('hostMove', 1), ('playerMove', -1)):
+        rows, index, action = _gather_moves(games, move_key)
+        if not len(rows):
+            continue
+        moves_made[rows] = True
+
+        # Apply claims and defends (defense is capped at +/-defense_cap)
+        current = boards[rows, index]
+        defended = np.clip(current + symbol, -defense_cap, defense_cap).astype(np.int8)
+        boards[rows, index] = np.select([action == CLAIM, action == DEFEND], [symbol, defended], current)
+
+        # Combat only affects adjacent enemy cells at strength 1
+        neighbours = adjacency[index]
+        enemy = boards[rows[:, None], neighbours] == -symbol
+        claim_hits = np.zeros(neighbours.shape, dtype=bool)
+        rolling = np.nonzero((action == CLAIM) & enemy.any(axis=1))[0]
+        for pos, row, flags, cells in zip(rolling.tolist(), rows[rolling].tolist(),
+                                          enemy[rolling].tolist(), neighbours[rolling].tolist()):
+            rng = rngs.get(row)
+            if rng is None:
+                rng = rngs[row] = round_rng(games[row])
+            for cell, slot in sorted((cell, slot) for slot, cell in enumerate(cells) if flags[slot]):
+                claim_hits[pos, slot] = rng.random() < neutralize_chance
+        defend_hits = ((action == DEFEND) & (np.abs(boards[rows, index]) > 1))[:, None]
+        hits = enemy & (claim_hits | defend_hits)
+        boards[np.broadcast_to(rows[:, None], neighbours.shape)[hits], neighbours[hits]] = 0
+
+    # Write back only the cells that changed so board masks and counters stay incremental
+    rows, cells = np.nonzero(boards[:, :size] != before[:, :size])
+    for row, idx, value in zip(rows.tolist(), cells.tolist(), boards[rows, cells].tolist()):
+        games[row].board[idx] = value
+
+    for game in games:
+        game.hostMove = None
+        game.playerMove = None
+
+    return moves_made.tolist()
+
+def _gather_moves(games, move_key):
+    rows, index, action = [], [], []
+    for row, game in enumerate(games):
+        move = getattr(game, move_key)
+        if move is not None:
+            # Packed as index << 1 | defend (see state.encode_move)
+            rows.append(row)
+            index.append(move >> 1)
+            action.append(DEFEND if move & 1 else CLAIM)
+    return (np.array(rows, dtype=np.intp), np.array(index, dtype=np.intp),
+            np.array(action, dtype=np.int8))
@@ -0,0 +1,221 @@
+"""Concurrent-connection benchmark for the Flask and asyncio server modes
+
+Starts app.py (Flask-SocketIO threads) and/or asgi.py (AsyncServer under
+uvicorn) as a subprocess, opens N Socket.IO connections spread over games,
+then queues one move per game and times how long the move_preview broadcast
+takes to reach every client. Reports connect latency, failures, server RSS
+and fan-out latency per mode and connection count:
+
+    python benchmarks/connections.py --modes flask asgi --connections 1000 10000 50000
+
+Clients use python-socketio's asyncio client, which needs aiohttp installed,
+and are spread over --client-procs processes. Past ~28k connections to one
+address the client runs out of ephemeral ports; widen
+net.ipv4.ip_local_port_range and raise `ulimit -n` on both sides first.
+"""
+import os, sys, json, time, asyncio, argparse, resource, subprocess, multiprocessing, urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load import _git_commit, RemoteClient
+from metrics import percentile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SERVERS = {'flask': 'app.py', 'asgi': 'asgi.py'}
+
+def raise_fd_limit():
+    """Lift the soft open-file limit to the hard limit; every connection is a socket"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of a process and its children (Flask's reloader forks one)"""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open('/proc/%s/stat' % entry) as f:
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except OSError:
+                continue
+    tree = {pid}
+    while True:
+        children = {child for child, parent in parents.items() if parent in tree} - tree
+        if not children:
+            break
+        tree |= children
+    total = 0
+    for member in tree:
+        try:
+            with open('/proc/%d/status' % member) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+def start_server(mode, port):
+    # No journal, archive or drain file: a run must not write into the working
+    # tree's, nor start by restoring the games of the run before it
+    env = dict(os.environ, PORT=str(port), JOURNAL_DIR='', ARCHIVE_PATH='', DRAIN_PATH='')
+    server = subprocess.Popen(
+        [sys.executable, SERVERS[mode]], cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, preexec_fn=raise_fd_limit
+    )
+    url = 'http://127.0.0.1:%d' % port
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + '/game/active', timeout=1).read()
+            return server, url
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('%s server did not start on port %d' % (mode, port))
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+def client_worker(url, gameCodes, connect_concurrency, connect_timeout, fanout_wait, ready, go, results):
+    """Open one connection per entry of gameCodes, then record move_preview arrival times"""
+    import socketio
+    raise_fd_limit()
+
+    async def main():
+        limit = asyncio.Semaphore(connect_concurrency)
+        latencies, failed, clients, received = [], 0, [], []
+
+        async def connect(gameCode):
+            nonlocal failed
+            client = socketio.AsyncClient(reconnection=False)
+            joined = asyncio.Event()
+            client.on('joined', lambda data: joined.set())
+            client.on('move_preview', lambda data: received.append((gameCode, time.time())))
+            async with limit:
+                start = time.perf_counter()
+                try:
+                    await client.connect(url, transports=['websocket'], wait_timeout=connect_timeout)
+                    await client.emit('join_game', {'gameCode': gameCode})
+                    await asyncio.wait_for(joined.wait(), connect_timeout)
+                except Exception:
+                    failed += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+                clients.append(client)
+
+        await asyncio.gather(*(connect(gameCode) for gameCode in gameCodes))
+        ready.put((latencies, failed))
+
+        # The parent queues the moves once every worker is connected
+        while not go.is_set():
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(fanout_wait)
+        results.put(received)
+
+        await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+
+    asyncio.run(main())
+
+def run_one(args, mode, connections):
+    server, url = start_server(mode, args.port)
+    try:
+        http = RemoteClient(url)
+        per_game = args.clients_per_game
+        games = []
+        for _ in range((connections + per_game - 1) // per_game):
+            status, game = http.post('/game/create', {})
+            http.post('/game/join', {'gameCode': game['gameCode']})
+            games.append(game)
+        codes = [games[i // per_game]['gameCode'] for i in range(connections)]
+
+        # Connect every client, spread over the worker processes
+        ready, results = multiprocessing.Queue(), multiprocessing.Queue()
+        go = multiprocessing.Event()
+        workers = [multiprocessing.Process(target=client_worker, args=(
+            url, codes[i::args.client_procs], args.connect_concurrency, args.connect_timeout,
+            args.fanout_wait, ready, go, results
+        )) for i in range(args.client_procs)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        latencies, failed = [], 0
+        for _ in workers:
+            worker_latencies, worker_failed = ready.get()
+            latencies.extend(worker_latencies)
+            failed += worker_failed
+        connect_elapsed = time.perf_counter() - start
+        rss = process_tree_rss(server.pid)
+
+        # Queue one move per game and time its move_preview reaching each client in the room
+        sent = {}
+        go.set()
+        for game in games:
+            sent[game['gameCode']] = time.time()
+            http.post('/game/move', {
+                'gameCode': game['gameCode'], 'playerId': game['hostId'],
+                'index': game['board'].index(1), 'moveType': 'defend'
+            })
+        fanout = []
+        for _ in workers:
+            fanout.extend(arrived - sent[gameCode] for gameCode, arrived in results.get())
+        for worker in workers:
+            worker.join()
+    finally:
+        stop_server(server)
+
+    return {
+        'mode': mode,
+        'connections': connections,
+        'connected': len(latencies),
+        'failed': failed,
+        'connectSeconds': connect_elapsed,
+        'connect_p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+        'connect_p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+        'rss_mb': rss / 2 ** 20,
+        'received': len(fanout),
+        'fanout_p50_ms': percentile(fanout, 50) * 1000 if fanout else None,
+        'fanout_p99_ms': percentile(fanout, 99) * 1000 if fanout else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=sorted(SERVERS), default=['flask', 'asgi'])
+    parser.add_argument('--connections', nargs='+', type=int, default=[1000, 10000, 50000])
+    parser.add_argument('--clients-per-game', type=int, default=10, help='socket clients joined to each game room')
+    parser.add_argument('--client-procs', type=int, default=os.cpu_count() or 1, help='client worker processes')
+    parser.add_argument('--connect-concurrency', type=int, default=200, help='in-flight connects per worker')
+    parser.add_argument('--connect-timeout', type=float, default=30.0, help='seconds before a connect counts as failed')
+    parser.add_argument('--fanout-wait', type=float, default=10.0, help='seconds to collect move previews')
+    parser.add_argument('--port', type=int, default=5099, help='port for the server under test')
+    parser.add_argument('--output', default='bench_connections.json', help='where to write the JSON results')
+    args = parser.parse_args()
+    raise_fd_limit()
+
+    results = []
+    for connections in args.connections:
+        for mode in args.modes:
+            result = run_one(args, mode, connections)
+            results.append(result)
+            print('%-5s %6d conn  %6d ok %6d failed  connect p50 %8.1f ms p99 %8.1f ms  rss %7.1f MB  '
+                  'fan-out %6d recv p50 %8.1f ms p99 %8.1f ms' % (
+                      mode, connections, result['connected'], result['failed'],
+                      result['connect_p50_ms'] or 0, result['connect_p99_ms'] or 0, result['rss_mb'],
+                      result['received'], result['fanout_p50_ms'] or 0, result['fanout_p99_ms'] or 0
+                  ))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': _git_commit(),
+            'timestamp': time.time(),
+            'config': vars(args),
+            'results': results
+        }, f, indent=2)
+    print('results written to %s' % args.output)
+
+if __name__ == '__main__':
+    main()
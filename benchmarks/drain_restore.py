@@ -0,0 +1,85 @@
+"""Drain benchmark: time to write every game out on shutdown and read them back on the next start
+
+Builds --games games of each kind (idle lobbies, active and finished games,
+as in benchmarks/memory.py, all awake) in one interpreter and drains them to
+a file with games.drain_games, then restores them in a fresh interpreter
+with games.open_drain, as a restart would. Fails if a restored game differs
+from the drained one other than by its clocks having moved on together:
+
+    python benchmarks/drain_restore.py --games 100000
+"""
+import os, sys, json, time, random, hashlib, argparse, tempfile, subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import games
+from memory import KINDS, build
+
+CLOCKS = ('creationTime', 'startTime', 'nextUpdateTime')
+
+def fingerprint():
+    """Hash of every game's snapshot record, with clocks taken relative to the earliest creationTime
+
+    A drain moves every clock by the same amount, so the hash survives it.
+    """
+    records = sorted(games.snapshot_records(), key=lambda record: record['gameCode'])
+    origin = min(record['creationTime'] for record in records)
+    for record in records:
+        for key in CLOCKS:
+            if record[key] != -1:
+                record[key] = round(record[key] - origin, 6)
+    return hashlib.sha256(json.dumps(records).encode()).hexdigest()
+
+def drain(args):
+    random.seed(args.seed)
+    build(args.kind, args.games, args.rounds, args.layout)
+    written, seconds = games.drain_games(args.path)
+    return {'games': written, 'seconds': seconds, 'bytes': os.path.getsize(args.path), 'fingerprint': fingerprint()}
+
+def restore(args):
+    start = time.perf_counter()
+    restored = games.open_drain(args.path)
+    seconds = time.perf_counter() - start
+    return {'games': restored, 'seconds': seconds, 'fingerprint': fingerprint()}
+
+def run(kind, phase, path, args):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--kind', kind, '--phase', phase,
+                             '--path', path, '--games', str(args.games), '--rounds', str(args.rounds),
+                             '--layout', args.layout, '--seed', str(args.seed)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100000, help='games of each kind to create')
+    parser.add_argument('--rounds', type=int, default=2, help='rounds played by active and finished games')
+    parser.add_argument('--layout', default='classic', help='board layout for created games')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--kind', choices=KINDS, help=argparse.SUPPRESS)
+    parser.add_argument('--phase', choices=('drain', 'restore'), help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    # Nothing is journaled; only the drain file is measured
+    games.journal = None
+
+    if args.phase:
+        print(json.dumps((drain if args.phase == 'drain' else restore)(args)))
+        return
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in KINDS:
+            path = os.path.join(directory, kind + '.drain')
+            drained = run(kind, 'drain', path, args)
+            restored = run(kind, 'restore', path, args)
+            print('%-8s %d games  drain %.3f s  restore %.3f s  total %.3f s  file %.1f MB (%.0f B/game)' % (
+                kind, drained['games'], drained['seconds'], restored['seconds'],
+                drained['seconds'] + restored['seconds'], drained['bytes'] / 2 ** 20,
+                drained['bytes'] / drained['games']))
+            if restored['games'] != drained['games'] or restored['fingerprint'] != drained['fingerprint']:
+                print('FAIL: restored %s games differ from the drained ones' % kind)
+                failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Hibernation benchmark: memory saved by freezing idle games and the cost of waking them
+
+Builds --games games of each kind (idle lobbies, active and finished games,
+as in benchmarks/memory.py) in a fresh interpreter, measures the heap they
+take awake, hibernates them all and measures it again, then wakes every game
+through games.get_game as a request would, timing each wake. Fails if any
+woken game differs from the game that was frozen:
+
+    python benchmarks/hibernation.py --games 20000
+"""
+import os, sys, json, time, random, hashlib, argparse, subprocess, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import games
+from metrics import percentile
+from memory import KINDS, build
+
+def fingerprint():
+    """Hash of every game's snapshot record, so comparing doesn't keep the records on the heap"""
+    records = sorted(games.snapshot_records(), key=lambda record: record['gameCode'])
+    return hashlib.sha256(json.dumps(records).encode()).hexdigest()
+
+def measure(args):
+    """Heap per game awake and hibernated, and wake latency, for args.kind"""
+    random.seed(args.seed)
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    build(args.kind, args.games, args.rounds, args.layout)
+    awake = tracemalloc.get_traced_memory()[0]
+    before = fingerprint()
+
+    # Far enough ahead that every game counts as idle, whatever its next round
+    gameCodes = list(games.activeGames)
+    games.hibernate_games(gameCodes, time.time() + 10 ** 6)
+    asleep = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    frozen = sum(map(len, games.hibernatedGames.values()))
+
+    timings = []
+    for gameCode in gameCodes:
+        wake_start = time.perf_counter()
+        games.get_game(gameCode)
+        timings.append(time.perf_counter() - wake_start)
+
+    return {
+        'kind': args.kind,
+        'games': len(gameCodes),
+        'awakeBytes': (awake - start) / len(gameCodes),
+        'asleepBytes': (asleep - start) / len(gameCodes),
+        'frozenBytes': frozen / len(gameCodes),
+        'wakeMicros': {pct: 1e6 * percentile(timings, pct) for pct in (50, 99)},
+        'identical': fingerprint() == before
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=20000, help='games of each kind to create')
+    parser.add_argument('--kind', choices=KINDS, help='only measure this kind, in this process, and print JSON')
+    parser.add_argument('--rounds', type=int, default=5, help='rounds played by active and finished games')
+    parser.add_argument('--layout', default='classic', help='board layout for created games')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    # Nothing is written to disk; only the in-memory state is measured
+    games.journal = None
+
+    if args.kind:
+        print(json.dumps(measure(args)))
+        return
+
+    # Each kind in a fresh interpreter so one measurement can't reuse another's freed memory
+    failed = False
+    for kind in KINDS:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--kind', kind,
+                                 '--games', str(args.games), '--rounds', str(args.rounds),
+                                 '--layout', args.layout, '--seed', str(args.seed)],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        print('%-8s awake %5.0f B/game  hibernated %5.0f B/game (%3.0f B frozen)  saved %5.0f B/game  '
+              'wake p50 %5.1f us  p99 %5.1f us' % (
+                  kind, result['awakeBytes'], result['asleepBytes'], result['frozenBytes'],
+                  result['awakeBytes'] - result['asleepBytes'],
+                  result['wakeMicros']['50'], result['wakeMicros']['99']))
+        if not result['identical']:
+            print('FAIL: woken %s games differ from the games that were frozen' % kind)
+            failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
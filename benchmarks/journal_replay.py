@@ -0,0 +1,110 @@
+"""Journal replay benchmark: how fast a restart rebuilds games from the journal
+
+Drives the game engine in-process with a journal open in a temporary
+directory until it has written --events events (creates, joins, moves,
+ticks and removals), then starts a fresh Python process that recovers the
+journal exactly as the server does on startup. Reports replay throughput and
+checks that the recovered games are identical to the ones that wrote it:
+
+    python benchmarks/journal_replay.py --events 1000000
+    python benchmarks/journal_replay.py --replay-only .journal  # time an existing journal
+"""
+import os, sys, json, time, random, hashlib, argparse, tempfile, subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import games
+
+def no_clients(room):
+    return False
+
+def digest():
+    """Hash of every active game's record, independent of dict order"""
+    records = sorted(games.snapshot_records(), key=lambda record: record['gameCode'])
+    return hashlib.sha256(json.dumps(records, sort_keys=True).encode()).hexdigest()
+
+def new_match(layout):
+    body, _ = games.create_game({'layout': layout})
+    games.join_game({'gameCode': body['gameCode']})
+    return body
+
+def generate(args, directory):
+    """Play games in simulated time until the journal holds args.events events"""
+    games.open_journal(directory)
+    games.journal.snapshot_every = args.snapshot_every
+    matches = [new_match(args.layout) for _ in range(args.games)]
+    now = time.time()
+
+    start = time.perf_counter()
+    while games.journal.last_seq() < args.events:
+        for i, match in enumerate(matches):
+            gameCode = match['gameCode']
+            game = games.activeGames.get(gameCode)
+            if game is None or game.gameOver:
+                # Finished games are removed and replaced to keep the load steady
+                games.remove_game(gameCode)
+                matches[i] = match = new_match(args.layout)
+                continue
+            body, _ = games.legal_moves({'gameCode': gameCode})
+            for side, playerId in (('host', match['hostId']), ('player', match['playerId'])):
+                cells = body[side]
+                if cells['defend'] and (not cells['claim'] or random.random() < 0.7):
+                    index, moveType = random.choice(cells['defend']), 'defend'
+                elif cells['claim']:
+                    index, moveType = random.choice(cells['claim']), 'claim'
+                else:
+                    continue
+                games.make_move({
+                    'gameCode': gameCode, 'playerId': playerId, 'index': index, 'moveType': moveType
+                }, no_clients)
+
+        # Tick every game at once, as the server does when they fall due together
+        now += 5
+        for match in matches:
+            games.scheduler.schedule(match['gameCode'], 'tick', now)
+        games.run_due(now, no_clients)
+
+    events = games.journal.last_seq()
+    elapsed = time.perf_counter() - start
+    games.close_journal()
+    return events, elapsed, digest()
+
+def replay(directory):
+    """Recover a journal the way the server does at startup"""
+    restored, replayed, seconds = games.open_journal(directory)
+    games.close_journal()
+    return {'games': restored, 'events': replayed, 'seconds': seconds, 'digest': digest()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000000, help='journal events to generate')
+    parser.add_argument('--games', type=int, default=2000, help='games played at once')
+    parser.add_argument('--layout', default='classic', help='board layout for created games')
+    parser.add_argument('--snapshot-every', type=int, default=10 ** 9,
+                        help='events between snapshots (default: never, so every event is replayed)')
+    parser.add_argument('--replay-only', metavar='DIR', help='only recover the journal in DIR and print JSON')
+    args = parser.parse_args()
+
+    if args.replay_only:
+        print(json.dumps(replay(args.replay_only)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        events, elapsed, expected = generate(args, directory)
+        print('wrote %d events in %.1f s (%.0f events/s)' % (events, elapsed, events / elapsed))
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print('journal size %.1f MB' % (size / 2 ** 20))
+
+        # Replay in a fresh interpreter so nothing is shared with the writer
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--replay-only', directory],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+
+    print('replayed %(events)d events into %(games)d games in %(seconds).2f s' % result
+          + ' (%.0f events/s)' % (result['events'] / result['seconds']))
+    if result['digest'] != expected:
+        print('FAIL: recovered games differ from the games that wrote the journal')
+        sys.exit(1)
+    print('OK: recovered games match')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""Load generator and latency benchmark for the game HTTP and socket API
+
+Simulates N concurrent games against app.py, either in-process through Flask's
+test client and the Flask-SocketIO test client, or against a running server
+with --url. Reports throughput and p50/p95/p99 latency per route plus tick
+duration, and writes everything to a JSON file so runs can be compared across
+commits:
+
+    python benchmarks/load.py --games 1000 --rounds 5 --output bench_results.json
+    python benchmarks/load.py --url http://127.0.0.1:5000 --games 200
+"""
+import os, sys, json, time, random, argparse, threading, subprocess, urllib.request, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from geometry import get_geometry
+from metrics import percentile
+
+def summarize(samples, elapsed):
+    """Latency percentiles in milliseconds plus throughput for one route"""
+    return {
+        'count': len(samples),
+        'throughput': len(samples) / elapsed if elapsed else None,
+        'p50_ms': percentile(samples, 50) * 1000 if samples else None,
+        'p95_ms': percentile(samples, 95) * 1000 if samples else None,
+        'p99_ms': percentile(samples, 99) * 1000 if samples else None,
+        'max_ms': max(samples) * 1000 if samples else None
+    }
+
+class LocalClient:
+    """Drives the app in-process; one instance per worker thread"""
+
+    def __init__(self, app_module):
+        self.app = app_module
+        self.http = app_module.app.test_client()
+
+    def post(self, path, body):
+        response = self.http.post(path, json=body)
+        return response.status_code, response.get_json()
+
+    def get(self, path, params):
+        response = self.http.get(path, query_string=params)
+        return response.status_code, response.get_json()
+
+    def socket_join(self, gameCode):
+        client = self.app.socketio.test_client(self.app.app)
+        client.emit('join_game', {'gameCode': gameCode})
+        client.get_received()
+        return client
+
+class RemoteClient:
+    """Drives a running server over real HTTP and Socket.IO connections"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def post(self, path, body):
+        request = urllib.request.Request(
+            self.url + path, data=json.dumps(body).encode(), method='POST',
+            headers={'Content-Type': 'application/json'}
+        )
+        return self._send(request)
+
+    def get(self, path, params):
+        return self._send(urllib.request.Request(self.url + path + '?' + urllib.parse.urlencode(params)))
+
+    def _send(self, request):
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read() or b'null')
+
+    def socket_join(self, gameCode):
+        import socketio  # python-socketio client, only needed for remote socket runs
+        joined = threading.Event()
+        client = socketio.Client()
+        client.on('joined', lambda data: joined.set())
+        client.connect(self.url)
+        client.emit('join_game', {'gameCode': gameCode})
+        joined.wait(10)
+        return client
+
+def pick_move(board, layout, symbol):
+    """Choose a move the server will accept for the side playing symbol"""
+    adjacency = get_geometry(layout).adjacency
+    owned = [idx for idx, value in enumerate(board) if value is not None and value * symbol > 0]
+    claimable = {
+        adj_idx for idx in owned for adj_idx in adjacency[idx] if board[adj_idx] == 0
+    }
+    if claimable and random.random() < 0.8:
+        return random.choice(sorted(claimable)), 'claim'
+    if owned:
+        return random.choice(owned), 'defend'
+    return None, None
+
+def run(args):
+    if args.url:
+        app_module = None
+        make_client = lambda: RemoteClient(args.url)
+    else:
+        import logging
+        import app as app_module
+        logging.disable(logging.INFO)
+        make_client = lambda: LocalClient(app_module)
+
+    local = threading.local()
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = make_client()
+        return local.client
+
+    samples = {}
+    elapsed = {}
+    def timed_phase(route, jobs):
+        """Run jobs across the worker pool, recording per-call latency for a route"""
+        latencies = []
+        def call(job):
+            start = time.perf_counter()
+            result = job(client())
+            latencies.append(time.perf_counter() - start)
+            return result
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.workers) as pool:
+            results = list(pool.map(call, jobs))
+        elapsed[route] = elapsed.get(route, 0) + time.perf_counter() - start
+        samples.setdefault(route, []).extend(latencies)
+        return results
+
+    # Create and join every game
+    created = timed_phase('/game/create', [
+        lambda c: c.post('/game/create', {'layout': args.layout}) for _ in range(args.games)
+    ])
+    games = [body for status, body in created if status == 200]
+    timed_phase('/game/join', [
+        lambda c, g=g: c.post('/game/join', {'gameCode': g['gameCode']}) for g in games
+    ])
+    sockets = []
+    if not args.no_sockets:
+        sockets = timed_phase('join_game', [
+            lambda c, g=g: c.socket_join(g['gameCode']) for g in games
+        ])
+
+    ticks = []
+    flushes = []
+    rejected = 0
+    for _ in range(args.rounds):
+        boards = timed_phase('/game/sync', [
+            lambda c, g=g: c.get('/game/sync', {'gameCode': g['gameCode']}) for g in games
+        ])
+
+        # Both sides of every game submit one move
+        jobs = []
+        for g, (status, state) in zip(games, boards):
+            if status != 200:
+                continue
+            for playerId, symbol in ((g['hostId'], 1), (g['playerId'], -1)):
+                index, moveType = pick_move(state['board'], args.layout, symbol)
+                if index is not None:
+                    jobs.append(lambda c, g=g, p=playerId, i=index, m=moveType: c.post('/game/move', {
+                        'gameCode': g['gameCode'], 'playerId': p, 'index': i, 'moveType': m
+                    }))
+        rejected += sum(1 for status, _ in timed_phase('/game/move', jobs) if status != 200)
+
+        # In-process runs resolve the round directly so tick cost can be measured
+        if app_module is not None:
+            core = app_module.games
+            due = [(g['gameCode'], core.activeGames[g['gameCode']])
+                   for g in games if g['gameCode'] in core.activeGames]
+            start = time.perf_counter()
+            results = core.resolve_games([game for _, game in due])
+            outbox = []
+            for (gameCode, game), moves_made in zip(due, results):
+                core.finish_tick(gameCode, game, moves_made, time.time(), outbox, app_module.room_has_clients)
+            ticks.append(time.perf_counter() - start)
+
+            # Broadcasts are flushed outside the tick, as the background broadcaster does
+            start = time.perf_counter()
+            app_module.broadcaster.deliver(outbox)
+            flushes.append(time.perf_counter() - start)
+        else:
+            time.sleep(args.tick_wait)
+
+        # Drain queued socket messages so the test clients don't grow without bound
+        for socket in sockets:
+            if hasattr(socket, 'get_received'):
+                socket.get_received()
+
+    for socket in sockets:
+        socket.disconnect()
+
+    # Snapshot encodes should track state changes, not the number of syncs
+    snapshotCache = None
+    if app_module is not None:
+        snapshotCache = {
+            '%s_%s' % labels: value for labels, value in app_module.games.SNAPSHOT_CACHE.values().items()
+        }
+
+    return {
+        'commit': _git_commit(),
+        'timestamp': time.time(),
+        'config': vars(args),
+        'routes': {route: summarize(samples[route], elapsed[route]) for route in samples},
+        'rejectedMoves': rejected,
+        'snapshotCache': snapshotCache,
+        'tick': {
+            'games': len(games),
+            'count': len(ticks),
+            'p50_ms': percentile(ticks, 50) * 1000 if ticks else None,
+            'max_ms': max(ticks) * 1000 if ticks else None,
+            'gamesPerSecond': len(games) * len(ticks) / sum(ticks) if ticks else None,
+            'flush_p50_ms': percentile(flushes, 50) * 1000 if flushes else None
+        }
+    }
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=200, help='concurrent games to simulate')
+    parser.add_argument('--rounds', type=int, default=5, help='move/tick rounds per game')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent client threads')
+    parser.add_argument('--layout', default='classic', help='board layout for created games')
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--tick-wait', type=float, default=5.0, help='seconds between rounds with --url')
+    parser.add_argument('--no-sockets', action='store_true', help='skip the join_game socket clients')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the JSON results')
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for route, stats in results['routes'].items():
+        print('%-14s %7d req  %9.1f req/s  p50 %7.2f ms  p95 %7.2f ms  p99 %7.2f ms' % (
+            route, stats['count'], stats['throughput'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms']
+        ))
+    if results['tick']['count']:
+        print('tick           %7d games  p50 %7.2f ms  max %7.2f ms  flush p50 %7.2f ms' % (
+            results['tick']['games'], results['tick']['p50_ms'], results['tick']['max_ms'],
+            results['tick']['flush_p50_ms']
+        ))
+    if results['snapshotCache']:
+        print('snapshot cache %s' % '  '.join(
+            '%s %d' % item for item in sorted(results['snapshotCache'].items())
+        ))
+    print('results written to %s' % args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Long-poll check: a held /game/sync answers within about one tick in each server mode
+
+Starts app.py (Flask-SocketIO, which runs under eventlet when it is installed,
+as requirements.txt pins) and/or asgi.py, starts --games games ticking every
+--tick-interval seconds, and holds a /game/sync?wait= request on each for
+--rounds rounds. Every poll must come back with the next round well before
+its wait runs out; fails otherwise:
+
+    python benchmarks/long_poll.py --modes flask asgi
+"""
+import os, sys, json, time, argparse, importlib.util, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from connections import start_server, stop_server
+from metrics import percentile
+
+def request(url, path, body=None, headers=None):
+    """(status, ETag, body) of one request; body, if given, is POSTed as JSON"""
+    req = urllib.request.Request(url + path, data=None if body is None else json.dumps(body).encode(),
+                                 headers=dict(headers or {}, **{'Content-Type': 'application/json'}))
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            return response.status, response.headers.get('ETag'), response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers.get('ETag'), error.read()
+
+def poll_rounds(url, gameCode, rounds, wait):
+    """Seconds each held sync on a started game took to see the next round"""
+    _, etag, _ = request(url, '/game/sync?gameCode=' + gameCode)
+    took = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        status, etag, _ = request(url, '/game/sync?gameCode=%s&wait=%g' % (gameCode, wait),
+                                  headers={'If-None-Match': etag})
+        took.append(time.perf_counter() - start if status == 200 else float('inf'))
+    return took
+
+def run(mode, port, args):
+    server, url = start_server(mode, port)
+    try:
+        gameCodes = []
+        for _ in range(args.games):
+            _, _, body = request(url, '/game/create', {'tickInterval': args.tick_interval})
+            gameCode = json.loads(body)['gameCode']
+            request(url, '/game/join', {'gameCode': gameCode})
+            gameCodes.append(gameCode)
+        with ThreadPoolExecutor(args.games) as pool:
+            took = [seconds for polls in pool.map(lambda gameCode: poll_rounds(url, gameCode, args.rounds, args.wait),
+                                                  gameCodes) for seconds in polls]
+    finally:
+        stop_server(server)
+    return took
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=('flask', 'asgi'), default=['flask', 'asgi'])
+    parser.add_argument('--games', type=int, default=20, help='games polled at once')
+    parser.add_argument('--rounds', type=int, default=5, help='held polls per game')
+    parser.add_argument('--tick-interval', type=int, default=1)
+    parser.add_argument('--wait', type=float, default=10, help='seconds each poll asks to be held')
+    parser.add_argument('--port', type=int, default=5310)
+    args = parser.parse_args()
+
+    # Each poll is answered when the round under way ends, so within one tick;
+    # the margin covers request handling on a busy machine
+    limit = args.tick_interval + 0.5
+    failed = False
+    for offset, mode in enumerate(args.modes):
+        if mode == 'flask':
+            label = 'flask (%s)' % ('eventlet' if importlib.util.find_spec('eventlet') else 'threading')
+        else:
+            label = mode
+        took = run(mode, args.port + offset, args)
+        slow = sum(seconds > limit for seconds in took)
+        print('%-17s %d polls  p50 %.2f s  p99 %.2f s  max %.2f s  over %.1f s: %d' % (
+            label, len(took), percentile(took, 50), percentile(took, 99), max(took), limit, slow))
+        failed = failed or slow > 0
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Memory benchmark: bytes the server holds per idle, active and finished game
+
+Creates --games games of one kind in a fresh interpreter with the journal
+off and measures the Python heap with tracemalloc before and after, so the
+figure covers everything a game costs: its state, board, codes, player ids,
+scheduler entries and its slot in activeGames.
+
+    idle      a created lobby waiting for an opponent
+    active    a joined game that has played --rounds rounds and has both
+              moves queued, with its JSON sync snapshot cached
+    finished  an active game that has then ended, snapshot cached
+
+    python benchmarks/memory.py --games 50000
+    python benchmarks/memory.py --kind idle --games 1000000 --rss  # actually hold a million lobbies
+
+Tracing every allocation makes runs several times slower and adds its own
+memory on top; --rss skips it and reports the growth in resident size.
+"""
+import os, sys, json, random, argparse, resource, subprocess, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import games
+
+KINDS = ('idle', 'active', 'finished')
+
+def no_clients(room):
+    return False
+
+def queue_moves(matches):
+    """Queue a random legal move for both sides of every match"""
+    for match in matches:
+        body, _ = games.legal_moves({'gameCode': match['gameCode']})
+        for side, playerId in (('host', match['hostId']), ('player', match['playerId'])):
+            cells = body[side]
+            moveType = 'claim' if cells['claim'] else 'defend'
+            if not cells[moveType]:
+                continue  # Already lost
+            games.make_move({
+                'gameCode': match['gameCode'], 'playerId': playerId,
+                'index': random.choice(cells[moveType]), 'moveType': moveType
+            }, no_clients)
+
+def build(kind, count, rounds, layout):
+    """Create count games of one kind and keep them alive in activeGames"""
+    matches = [games.create_game({'layout': layout})[0] for _ in range(count)]
+    if kind == 'idle':
+        return
+
+    for match in matches:
+        games.join_game({'gameCode': match['gameCode']})
+    now = max(game.nextUpdateTime for game in games.activeGames.values())
+    for _ in range(rounds):
+        queue_moves(matches)
+        now += games.TICK_INTERVAL
+        for match in matches:
+            games.scheduler.schedule(match['gameCode'], 'tick', now)
+        games.run_due(now, no_clients)
+    queue_moves(matches)
+
+    for gameCode, game in games.activeGames.items():
+        if kind == 'finished':
+            # Ended the way finish_tick ends a game, then kept until it times out
+            with game.lock:
+                game.gameOver = True
+                game.winner = 'host'
+                game.hostMove = game.playerMove = None
+                games.touch_state(gameCode, game)
+            games.scheduler.cancel(gameCode, 'tick')
+        games.cached_snapshot(game, 'json')
+
+def max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def measure(args):
+    """Bytes per game of args.kind, measured in this process"""
+    random.seed(args.seed)
+    if args.rss:
+        before = max_rss()
+        build(args.kind, args.games, args.rounds, args.layout)
+        after = max_rss()
+    else:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        build(args.kind, args.games, args.rounds, args.layout)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    return {
+        'kind': args.kind,
+        'games': len(games.activeGames),
+        'bytesPerGame': (after - before) / args.games,
+        'maxRssMB': max_rss() / 2 ** 20
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=20000, help='games of each kind to create')
+    parser.add_argument('--kind', choices=KINDS, help='only measure this kind, in this process')
+    parser.add_argument('--rounds', type=int, default=5, help='rounds played by active and finished games')
+    parser.add_argument('--layout', default='classic', help='board layout for created games')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rss', action='store_true',
+                        help='measure resident size growth instead of tracing allocations; '
+                             'much faster and includes allocator overhead, but less exact')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    args = parser.parse_args()
+    # Nothing is written to disk; only the in-memory state is measured
+    games.journal = None
+
+    if args.kind:
+        result = measure(args)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print('%(kind)s: %(bytesPerGame).0f bytes per game over %(games)d games, max RSS %(maxRssMB).0f MB'
+                  % result)
+        return
+
+    # Each kind in a fresh interpreter so one measurement can't reuse another's freed memory
+    for kind in KINDS:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--kind', kind, '--json',
+                                 '--games', str(args.games), '--rounds', str(args.rounds),
+                                 '--layout', args.layout, '--seed', str(args.seed)] + ['--rss'] * args.rss,
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        print('%-8s %6.0f bytes/game  (%d games, max RSS %.0f MB)' % (
+            kind, result['bytesPerGame'], result['games'], result['maxRssMB']))
+        if kind == 'idle':
+            print('         1M parked lobbies: %.2f GB' % (result['bytesPerGame'] * 1e6 / 2 ** 30))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Quick-match queue benchmark under a launch-day style arrival burst
+
+Feeds --players arrivals through games.quickmatch in-process, one fake
+socket id each. A --dropout fraction of queued players disconnect before
+they are matched, leaving dead tickets in the queue. Reports arrivals per
+second, how many players were paired, dropped or left waiting, and the
+pairing cost at the start and end of the run; with O(1) pairing the two stay
+flat however long the queue gets:
+
+    python benchmarks/quickmatch.py --players 200000 --dropout 0.3
+"""
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import games
+
+def run(args):
+    rng = random.Random(args.seed)
+    connected = set()
+    queued = []
+    paired = dropped = 0
+    timings = []
+
+    start = time.perf_counter()
+    for number in range(args.players):
+        sid = 's%d' % number
+        connected.add(sid)
+
+        # Some players waiting in line give up before an opponent arrives
+        if queued and rng.random() < args.dropout:
+            gone = queued.pop(rng.randrange(len(queued)))
+            connected.discard(gone)
+            games.leave_quickmatch(gone)
+            dropped += 1
+
+        # Arrivals come in bursts, so the queue grows before it drains
+        data = {}
+        if rng.random() < args.burst:
+            data['layout'] = 'hexagon'
+        call_start = time.perf_counter()
+        event, payload, messages = games.quickmatch(sid, data, connected.__contains__)
+        timings.append(time.perf_counter() - call_start)
+        if event == 'matched':
+            paired += 2
+            queued = [queued_sid for queued_sid in queued if queued_sid != messages[0][2]]
+        else:
+            queued.append(sid)
+    elapsed = time.perf_counter() - start
+
+    head, tail = timings[:1000], timings[-1000:]
+    return {
+        'players': args.players,
+        'seconds': elapsed,
+        'paired': paired,
+        'dropped': dropped,
+        'waiting': len(games.quickmatchTickets),
+        'firstMicros': 1e6 * sum(head) / len(head),
+        'lastMicros': 1e6 * sum(tail) / len(tail),
+        'games': len(games.activeGames)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=100000, help='players arriving')
+    parser.add_argument('--dropout', type=float, default=0.3, help='chance per arrival that a waiting player leaves')
+    parser.add_argument('--burst', type=float, default=0.1,
+                        help='share of players asking for another layout, so two queues are in use')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    # Keep lobbies and games from being journaled or ticked; only the queue is measured
+    games.journal = None
+
+    results = run(args)
+    print('%(players)d arrivals in %(seconds).2f s  paired %(paired)d  dropped %(dropped)d  '
+          'still waiting %(waiting)d  games %(games)d' % results)
+    print('quickmatch() %.1f us/call over the first 1000 arrivals, %.1f us over the last 1000'
+          % (results['firstMicros'], results['lastMicros']))
+    print('%.0f arrivals/s' % (results['players'] / results['seconds']))
+
+if __name__ == '__main__':
+    main()
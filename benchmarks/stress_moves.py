@@ -0,0 +1,173 @@
+"""Concurrency stress test for moves submitted while ticks are running
+
+Creates --games games in-process and gives each side of each game its own
+submitter thread. A submitter queues one legal move at a time through
+games.make_move and waits for a tick to apply it. Meanwhile a tick thread
+resolves every game back to back, so moves keep landing mid-tick. Every move
+a tick reads is counted, and the run fails if an accepted move is never
+applied (lost) or is applied more than once:
+
+    python benchmarks/stress_moves.py --games 300 --seconds 20
+    python benchmarks/stress_moves.py --unsafe  # no per-game locks; should report lost moves
+"""
+import os, sys, time, random, argparse, threading, collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import games
+
+class NoLock:
+    """Stand-in for a game lock that doesn't lock, to show the test catches the race"""
+
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+def no_clients(room):
+    return False
+
+def run(args):
+    games.BATCH_MIN_GAMES = args.batch_min_games
+
+    codes = []
+    code_of = {}
+    for _ in range(args.games):
+        body, _ = games.create_game({'layout': args.layout})
+        games.join_game({'gameCode': body['gameCode']})
+        game = games.activeGames[body['gameCode']]
+        if args.unsafe:
+            game.lock = NoLock()
+        codes.append((body['gameCode'], body['hostId'], body['playerId']))
+        code_of[id(game)] = body['gameCode']
+
+    accepted = collections.Counter()  # (gameCode, side) -> moves make_move accepted
+    applied = collections.Counter()   # (gameCode, side) -> moves a tick read and applied
+    rejected = collections.Counter()
+    lost_waits = collections.Counter()
+    applied_changed = threading.Condition()
+
+    # Count the moves each tick applies; run_due calls this with every due game's lock held
+    resolve_games = games.resolve_games
+    def counting_resolve(due_games):
+        for game in due_games:
+            for move_key, side in (('hostMove', 'host'), ('playerMove', 'player')):
+                if getattr(game, move_key) is not None:
+                    applied[(code_of[id(game)], side)] += 1
+        return resolve_games(due_games)
+    games.resolve_games = counting_resolve
+
+    stop = threading.Event()
+    ticks = [0]
+
+    def tick_loop():
+        while not stop.is_set():
+            now = time.time()
+            for gameCode, _, _ in codes:
+                game = games.activeGames.get(gameCode)
+                if game is not None:
+                    # Ticks here run far faster than moves, so keep idle games from timing out
+                    game.timeout = 0
+                    games.scheduler.schedule(gameCode, 'tick', now)
+            games.run_due(now, no_clients)
+            ticks[0] += 1
+            with applied_changed:
+                applied_changed.notify_all()
+
+    def submitter(gameCode, playerId, side):
+        key = (gameCode, side)
+        while not stop.is_set():
+            body, status = games.legal_moves({'gameCode': gameCode})
+            if status != 200:
+                return
+            cells = body[side]
+            if cells['defend'] and (not cells['claim'] or random.random() < 0.7):
+                index, moveType = random.choice(cells['defend']), 'defend'
+            elif cells['claim']:
+                index, moveType = random.choice(cells['claim']), 'claim'
+            else:
+                return  # Game over
+
+            _, status, _ = games.make_move({
+                'gameCode': gameCode, 'playerId': playerId, 'index': index, 'moveType': moveType
+            }, no_clients)
+            if status != 200:
+                # The board moved on since legal_moves; a rejected move is never queued
+                rejected[key] += 1
+                continue
+            accepted[key] += 1
+
+            # Wait for a tick to apply it before queueing the next one
+            with applied_changed:
+                if not applied_changed.wait_for(lambda: applied[key] >= accepted[key] or stop.is_set(),
+                                                args.apply_timeout):
+                    lost_waits[key] += 1
+                    return
+
+    threads = [threading.Thread(target=tick_loop)]
+    for gameCode, hostId, playerId in codes:
+        threads.append(threading.Thread(target=submitter, args=(gameCode, hostId, 'host')))
+        threads.append(threading.Thread(target=submitter, args=(gameCode, playerId, 'player')))
+
+    start = time.perf_counter()
+    for thread in threads[1:]:
+        thread.start()
+    threads[0].start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Moves accepted in the last moments are applied by one more tick
+    now = time.time()
+    for gameCode, _, _ in codes:
+        if gameCode in games.activeGames:
+            games.scheduler.schedule(gameCode, 'tick', now)
+    games.run_due(now, no_clients)
+    games.resolve_games = resolve_games
+
+    keys = set(accepted) | set(applied)
+    lost = sum(max(0, accepted[key] - applied[key]) for key in keys)
+    duplicated = sum(max(0, applied[key] - accepted[key]) for key in keys)
+    return {
+        'games': args.games,
+        'seconds': elapsed,
+        'ticks': ticks[0],
+        'accepted': sum(accepted.values()),
+        'applied': sum(applied.values()),
+        'rejected': sum(rejected.values()),
+        'lost': lost,
+        'duplicated': duplicated,
+        'stalledSides': len(lost_waits)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=300, help='games, each with two submitter threads')
+    parser.add_argument('--seconds', type=float, default=10.0, help='how long to run')
+    parser.add_argument('--layout', default='classic', help='board layout for created games')
+    parser.add_argument('--batch-min-games', type=int, default=games.BATCH_MIN_GAMES,
+                        help='due games needed to use the batch engine (default: the server setting)')
+    parser.add_argument('--apply-timeout', type=float, default=5.0,
+                        help='seconds an accepted move may wait to be applied before it counts as lost')
+    parser.add_argument('--unsafe', action='store_true', help='replace game locks with no-ops')
+    args = parser.parse_args()
+
+    results = run(args)
+    print('%(games)d games  %(ticks)d ticks in %(seconds).1f s  accepted %(accepted)d  applied %(applied)d  '
+          'rejected %(rejected)d' % results)
+    print('lost %(lost)d  duplicated %(duplicated)d  stalled sides %(stalledSides)d' % results)
+    if results['lost'] or results['duplicated']:
+        print('FAIL: moves were lost or applied twice')
+        sys.exit(1)
+    print('OK: every accepted move was applied exactly once')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+from array import array
+
+def iter_bits(mask):
+    """Yield the index of every set bit in a mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class Board:
+    """Hex board stored as an int8 buffer plus per-side ownership bitmasks
+
+    Cell values match the list boards sent to the frontend: None for spaces
+    outside the map, 0 for unclaimed, 1/2 for host and -1/-2 for player cells.
+    Territory counters are kept up to date on every write so win checks and
+    the first-move test never scan the board. When the board knows its
+    neighbours, each side's frontier (empty cells next to its territory) is
+    kept up to date too, so legal moves are a bitmask lookup.
+    """
+    __slots__ = ('cells', 'valid', 'host', 'player', 'changed',
+                 'host_cells', 'player_cells', 'host_fortified', 'player_fortified',
+                 'neighbours', 'host_near', 'player_near', 'host_frontier', 'player_frontier')
+
+    def __init__(self, cells, valid, host=0, player=0, counts=(0, 0, 0, 0),
+                 neighbours=(), near=None, frontier=(0, 0)):
+        self.cells = cells    # array('b'), 0 for cells outside the map
+        self.valid = valid    # bit i set if cell i is playable
+        self.host = host      # bit i set if cells[i] > 0
+        self.player = player  # bit i set if cells[i] < 0
+        self.changed = None   # indices written since the last take_changes(), if any
+        # Live territory counts: owned cells and fortress-level (+/-2) cells per side
+        self.host_cells, self.player_cells, self.host_fortified, self.player_fortified = counts
+        # Neighbour indices per cell, shared by every board on a layout
+        self.neighbours = neighbours
+        # Per cell, how many neighbours each side owns
+        if near is None:
+            near = (array('b', bytes(len(cells))), array('b', bytes(len(cells))))
+        self.host_near, self.player_near = near
+        # Bit i set if cell i is empty and next to that side's territory
+        self.host_frontier, self.player_frontier = frontier
+
+    @classmethod
+    def from_config(cls, config, neighbours=()):
+        """Build a board from a flat list where None marks non-playable spaces"""
+        board = cls(array('b', bytes(len(config))), 0, neighbours=neighbours)
+        for idx, value in enumerate(config):
+            if value is not None:
+                board.valid |= 1 << idx
+                board[idx] = value
+        board.changed = None
+        return board
+
+    @classmethod
+    def from_cells(cls, cells, valid, neighbours=()):
+        """Build a board from its cell buffer in one pass instead of replaying a write per cell"""
+        host = player = 0
+        host_cells = player_cells = host_fortified = player_fortified = 0
+        host_near, player_near = array('b', bytes(len(cells))), array('b', bytes(len(cells)))
+        for idx, value in enumerate(cells):
+            if not value:
+                continue
+            if value > 0:
+                host |= 1 << idx
+                host_cells += 1
+                host_fortified += value == 2
+                near = host_near
+            else:
+                player |= 1 << idx
+                player_cells += 1
+                player_fortified += value == -2
+                near = player_near
+            for adj_idx in neighbours[idx] if neighbours else ():
+                near[adj_idx] += 1
+
+        # Frontiers are the empty playable cells next to each side
+        host_frontier = player_frontier = 0
+        if neighbours:
+            for idx in iter_bits(valid & ~(host | player)):
+                if host_near[idx]:
+                    host_frontier |= 1 << idx
+                if player_near[idx]:
+                    player_frontier |= 1 << idx
+        return cls(cells, valid, host, player, (host_cells, player_cells, host_fortified, player_fortified),
+                   neighbours, (host_near, player_near), (host_frontier, player_frontier))
+
+    def copy(self):
+        return Board(array('b', self.cells), self.valid, self.host, self.player, self.counts(),
+                     self.neighbours, (array('b', self.host_near), array('b', self.player_near)),
+                     (self.host_frontier, self.player_frontier))
+
+    def counts(self):
+        """Territory counters as (host_cells, player_cells, host_fortified, player_fortified)"""
+        return (self.host_cells, self.player_cells, self.host_fortified, self.player_fortified)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __getitem__(self, idx):
+        value = self.cells[idx]
+        return value if self.valid >> idx & 1 else None
+
+    def __setitem__(self, idx, value):
+        bit = 1 << idx
+        if not self.valid & bit:
+            raise IndexError('cell %d is not on the board' % idx)
+        old = self.cells[idx]
+        if old == value:
+            return
+        self._count(old, -1)
+        self._count(value, 1)
+        self.cells[idx] = value
+        old_side, new_side = (old > 0) - (old < 0), (value > 0) - (value < 0)
+        if old_side != new_side and self.neighbours:
+            self._move_border(idx, old_side, new_side)
+        if self.changed is None:
+            self.changed = set()
+        self.changed.add(idx)
+        self.host = self.host | bit if value > 0 else self.host & ~bit
+        self.player = self.player | bit if value < 0 else self.player & ~bit
+
+    def __iter__(self):
+        valid = self.valid
+        for idx, value in enumerate(self.cells):
+            yield value if valid >> idx & 1 else None
+
+    def _count(self, value, delta):
+        if value > 0:
+            self.host_cells += delta
+            if value == 2:
+                self.host_fortified += delta
+        elif value < 0:
+            self.player_cells += delta
+            if value == -2:
+                self.player_fortified += delta
+
+    def _move_border(self, idx, old_side, new_side):
+        # A cell changed hands: update its own frontier bits and its neighbours' counts
+        bit = 1 << idx
+        if new_side == 0:
+            if self.host_near[idx]:
+                self.host_frontier |= bit
+            if self.player_near[idx]:
+                self.player_frontier |= bit
+        elif old_side == 0:
+            self.host_frontier &= ~bit
+            self.player_frontier &= ~bit
+
+        cells, host_near, player_near = self.cells, self.host_near, self.player_near
+        for adj_idx in self.neighbours[idx]:
+            adj_bit = 1 << adj_idx
+            if old_side > 0:
+                host_near[adj_idx] -= 1
+                if not host_near[adj_idx]:
+                    self.host_frontier &= ~adj_bit
+            elif old_side < 0:
+                player_near[adj_idx] -= 1
+                if not player_near[adj_idx]:
+                    self.player_frontier &= ~adj_bit
+            if new_side > 0:
+                host_near[adj_idx] += 1
+                if not cells[adj_idx]:
+                    self.host_frontier |= adj_bit
+            elif new_side < 0:
+                player_near[adj_idx] += 1
+                if not cells[adj_idx]:
+                    self.player_frontier |= adj_bit
+
+    def cell_count(self, symbol):
+        """Number of cells owned by the side playing symbol"""
+        return self.host_cells if symbol > 0 else self.player_cells
+
+    def verify_counters(self):
+        """Cross-check the incremental counters and masks against a full scan"""
+        cells = [value for value in self if value is not None]
+        expected = (
+            sum(1 for value in cells if value > 0),
+            sum(1 for value in cells if value < 0),
+            cells.count(2),
+            cells.count(-2),
+        )
+        if self.counts() != expected:
+            raise AssertionError('board counters %r do not match scan %r' % (self.counts(), expected))
+        host = sum(1 << idx for idx, value in enumerate(self) if value is not None and value > 0)
+        player = sum(1 << idx for idx, value in enumerate(self) if value is not None and value < 0)
+        if (self.host, self.player) != (host, player):
+            raise AssertionError('board ownership masks do not match scan')
+        if self.neighbours:
+            empty = self.valid & ~(host | player)
+            frontiers = tuple(
+                sum(1 << idx for idx in iter_bits(empty) if any(owned >> adj & 1 for adj in self.neighbours[idx]))
+                for owned in (host, player)
+            )
+            if (self.host_frontier, self.player_frontier) != frontiers:
+                raise AssertionError('board frontier masks do not match scan')
+
+    def take_changes(self):
+        """Return [index, value] pairs for cells whose value changed since the last call"""
+        changed, self.changed = self.changed, None
+        if not changed:
+            return []
+        # A cell changed and then changed back within one round is still reported, which is harmless
+        return [[idx, self.cells[idx]] for idx in sorted(changed)]
+
+    def owned(self, symbol):
+        """Bitmask of cells owned by the side playing symbol (1 host, -1 player)"""
+        return self.host if symbol > 0 else self.player
+
+    def claimable(self, symbol):
+        """Bitmask of empty cells the side playing symbol may claim
+
+        Claims must touch the side's territory, except for a side that owns
+        nothing, which may claim any empty cell.
+        """
+        if self.cell_count(symbol):
+            return self.host_frontier if symbol > 0 else self.player_frontier
+        return self.valid & ~(self.host | self.player)
+
+    def legal(self, symbol, moveType):
+        """Bitmask of cells where the side playing symbol may make a 'claim' or 'defend' move"""
+        if moveType == 'claim':
+            return self.claimable(symbol)
+        if moveType == 'defend':
+            return self.owned(symbol)
+        return 0
+
+    def to_list(self):
+        """List form sent to the frontend"""
+        return list(self)
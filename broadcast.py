@@ -0,0 +1,85 @@
+import time, asyncio, threading, collections
+import metrics
+
+QUEUE_DEPTH = metrics.Gauge('broadcast_queue_depth', 'Messages waiting to be flushed to socket rooms')
+FLUSH_LATENCY = metrics.Histogram(
+    'broadcast_flush_latency_seconds', 'Time from a tick publishing its updates to the last one being sent')
+FLUSH_SIZE = metrics.Histogram(
+    'broadcast_flush_messages', 'Messages sent per flushed batch', buckets=(1, 10, 100, 1000, 10000, 100000))
+
+class Broadcaster:
+    """Collects the room broadcasts produced by a tick and sends them from a background thread
+
+    The game loop publishes one batch of (event, payload, room) messages per
+    tick, with every payload already built, and goes back to scheduling while
+    this thread does the socket I/O.
+    """
+
+    def __init__(self, emit):
+        self._emit = emit  # callable(event, payload, room)
+        self._batches = collections.deque()
+        self._pending = 0
+        self._ready = threading.Condition()
+
+    def publish(self, messages):
+        """Queue a tick's messages for the flush thread"""
+        if not messages:
+            return
+        with self._ready:
+            self._batches.append((time.perf_counter(), messages))
+            self._pending += len(messages)
+            QUEUE_DEPTH.set(self._pending)
+            self._ready.notify()
+
+    def deliver(self, messages):
+        """Send messages right away, in the order they were produced"""
+        for event, payload, room in messages:
+            self._emit(event, payload, room)
+
+    def run(self):
+        """Flush published batches forever; run in its own thread"""
+        while True:
+            with self._ready:
+                while not self._batches:
+                    self._ready.wait()
+                published, messages = self._batches.popleft()
+
+            self.deliver(messages)
+
+            with self._ready:
+                self._pending -= len(messages)
+                QUEUE_DEPTH.set(self._pending)
+            FLUSH_SIZE.observe(len(messages))
+            FLUSH_LATENCY.observe(time.perf_counter() - published)
+
+class AsyncBroadcaster:
+    """Broadcaster for the asyncio server: same publish/run contract, awaiting an async emit"""
+
+    def __init__(self, emit):
+        self._emit = emit  # coroutine function(event, payload, room)
+        self._batches = asyncio.Queue()
+        self._pending = 0
+
+    def publish(self, messages):
+        """Queue a tick's messages for the flush task; call from the event loop"""
+        if not messages:
+            return
+        self._batches.put_nowait((time.perf_counter(), messages))
+        self._pending += len(messages)
+        QUEUE_DEPTH.set(self._pending)
+
+    async def deliver(self, messages):
+        """Send messages right away, in the order they were produced"""
+        for event, payload, room in messages:
+            await self._emit(event, payload, room)
+
+    async def run(self):
+        """Flush published batches forever; run as an asyncio task"""
+        while True:
+            published, messages = await self._batches.get()
+            await self.deliver(messages)
+
+            self._pending -= len(messages)
+            QUEUE_DEPTH.set(self._pending)
+            FLUSH_SIZE.observe(len(messages))
+            FLUSH_LATENCY.observe(time.perf_counter() - published)
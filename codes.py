@@ -0,0 +1,148 @@
+import random, marshal, threading
+
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+# Letters as base-26 digits, so int() decodes a whole code at once
+_DIGITS = str.maketrans(ALPHABET, '0123456789abcdefghijklmnop')
+
+class _CodePool:
+    """Every code of one length, kept as a lazily shuffled array
+
+    Positions below `remaining` hold free codes and the rest hold allocated
+    ones. Only positions that were ever swapped are stored, so memory is
+    proportional to the number of codes handed out rather than the code space.
+    """
+
+    def __init__(self, length):
+        self.length = length
+        self.capacity = len(ALPHABET) ** length
+        self.remaining = self.capacity
+        self._values = {}     # position -> code number, where they differ
+        self._positions = {}  # code number -> position, where they differ
+
+    def allocated(self):
+        return self.capacity - self.remaining
+
+    def occupancy(self):
+        return self.allocated() / self.capacity
+
+    def take(self):
+        """Draw a uniformly random free code"""
+        last = self.remaining - 1
+        self._swap(random.randrange(self.remaining), last)
+        self.remaining = last
+        return self._encode(self._values.get(last, last))
+
+    def give(self, code):
+        """Return an allocated code to the free positions; False if it wasn't allocated"""
+        position = self._position(code)
+        if position is None or position < self.remaining:
+            return False
+        self._swap(position, self.remaining)
+        self.remaining += 1
+        return True
+
+    def reserve(self, code):
+        """Mark a specific code as allocated; False if it already was"""
+        position = self._position(code)
+        if position is None or position >= self.remaining:
+            return False
+        last = self.remaining - 1
+        self._swap(position, last)
+        self.remaining = last
+        return True
+
+    def _swap(self, a, b):
+        if a == b:
+            return
+        value_a = self._values.get(a, a)
+        value_b = self._values.get(b, b)
+        for position, value in ((a, value_b), (b, value_a)):
+            if position == value:
+                self._values.pop(position, None)
+                self._positions.pop(value, None)
+            else:
+                self._values[position] = value
+                self._positions[value] = position
+
+    def _position(self, code):
+        if len(code) != self.length or not (code.isascii() and code.isalpha() and code.isupper()):
+            return None
+        number = int(code.translate(_DIGITS), len(ALPHABET))
+        return self._positions.get(number, number)
+
+    def _encode(self, number):
+        letters = []
+        for _ in range(self.length):
+            number, digit = divmod(number, len(ALPHABET))
+            letters.append(ALPHABET[digit])
+        return ''.join(reversed(letters))
+
+class CodeAllocator:
+    """Hands out unique uppercase codes in O(1) and recycles released ones
+
+    Codes start at `length` letters. New codes use the shortest length whose
+    pool is below `max_occupancy`, so the code length grows automatically as
+    the space fills up (and shrinks back once enough codes are released).
+    """
+
+    def __init__(self, length=4, max_occupancy=0.5):
+        self.length = length
+        self.max_occupancy = max_occupancy
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        with self._lock:
+            length = self.length
+            while self._pool(length).occupancy() >= self.max_occupancy:
+                length += 1
+            return self._pool(length).take()
+
+    def release(self, code):
+        """Free a code so it can be handed out again"""
+        with self._lock:
+            pool = self._pools.get(len(code))
+            return pool is not None and pool.give(code)
+
+    def reserve(self, code):
+        """Claim a specific code, e.g. one restored from disk; False if it's taken"""
+        with self._lock:
+            return self._pool(len(code)).reserve(code)
+
+    def reserve_many(self, codes):
+        """reserve() every code under one lock, e.g. a whole restore; returns how many were free"""
+        with self._lock:
+            return sum(self._pool(len(code)).reserve(code) for code in codes)
+
+    def dump(self):
+        """Every pool's state as bytes, for load() into a fresh allocator after a restart"""
+        with self._lock:
+            # Version 2 has no shared-reference tracking, which makes dumping large pools several times faster
+            return marshal.dumps({length: (pool.remaining, pool._values) for length, pool in self._pools.items()}, 2)
+
+    def load(self, data):
+        """Take over the state dump() returned; False, changing nothing, once any code is out"""
+        with self._lock:
+            if any(pool.allocated() for pool in self._pools.values()):
+                return False
+            for length, (remaining, values) in marshal.loads(data).items():
+                pool = self._pool(length)
+                pool.remaining, pool._values = remaining, values
+                # Positions are the exact inverse of values, so they needn't be written
+                pool._positions = {value: position for position, value in values.items()}
+            return True
+
+    def occupancy(self):
+        """Fraction of the base-length code space in use, for alerting before growth"""
+        with self._lock:
+            return self._pool(self.length).occupancy()
+
+    def __len__(self):
+        with self._lock:
+            return sum(pool.allocated() for pool in self._pools.values())
+
+    def _pool(self, length):
+        pool = self._pools.get(length)
+        if pool is None:
+            pool = self._pools[length] = _CodePool(length)
+        return pool
@@ -0,0 +1,92 @@
+import os, struct
+from array import array
+from itertools import accumulate
+from collections import namedtuple
+
+# Where the server writes every game when it is told to stop (SIGTERM) and reads
+# them back on the next start; set DRAIN_PATH to an empty string to stop without
+# keeping them (the journal, if on, still restores them, without moving their clocks)
+DRAIN_PATH = os.environ.get(
+    'DRAIN_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.drain')
+)
+
+# The file: this header, the CodeAllocator.dump() of the game codes and of the
+# player ids, the game codes joined by NUL, then one array per field below with
+# an entry per game (frozen length, deadline kind, deadline, clock shift), then
+# every game's GameState.freeze() bytes back to back. Everything but the frozen
+# games reads back in bulk, so restoring does little work per game. Arrays are
+# in native byte order; the file is read back by the same machine.
+_header = struct.Struct('<8sdQQIIII')  # magic, drainedAt, journal segment, journal seq, games, dump lengths, codes length
+MAGIC = b'UHDRAIN2'
+
+# The deadline each drained game is waiting for
+KINDS = ('expire', 'archive', 'tick')
+_KIND_INDEX = {kind: index for index, kind in enumerate(KINDS)}
+
+# Parallel lists, one entry per game: its code, GameState.freeze() bytes, the kind
+# and time of its next deadline, and how far thaw() must move its clocks on
+DrainedGames = namedtuple('DrainedGames', 'gameCodes frozen kinds deadlines shifts')
+
+def write_drain(path, drainedAt, position, codes, drained):
+    """Write a DrainedGames to path in one go, replacing any older drain file
+
+    position is the journal's (segment, seq) once the games were frozen, or
+    (0, 0) without a journal; codes is the (game codes, player ids) pair of
+    allocator dumps. The file only appears once it is complete.
+    """
+    gameCodes = '\0'.join(drained.gameCodes).encode()
+    parts = [_header.pack(MAGIC, drainedAt, position[0], position[1], len(drained.gameCodes),
+                          len(codes[0]), len(codes[1]), len(gameCodes)),
+             codes[0], codes[1], gameCodes,
+             array('I', map(len, drained.frozen)).tobytes(),
+             array('B', map(_KIND_INDEX.__getitem__, drained.kinds)).tobytes(),
+             array('d', drained.deadlines).tobytes(),
+             array('d', drained.shifts).tobytes()]
+    parts.extend(drained.frozen)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b''.join(parts))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _array(typecode, data, offset, count):
+    values = array(typecode)
+    values.frombytes(data[offset:offset + count * values.itemsize])
+    return values, offset + count * values.itemsize
+
+def read_drain(path):
+    """The drain file at path as a dict, or None if there is none
+
+    'games' is the DrainedGames and 'codes' the pair of allocator dumps;
+    'drainedAt', 'journalSegment' and 'journalSeq' are as written.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    magic, drainedAt, segment, seq, count, gameCodesLength, playerIdsLength, codesLength = _header.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('%s is not a drain file' % path)
+    offset = _header.size
+    codes = (data[offset:offset + gameCodesLength],
+             data[offset + gameCodesLength:offset + gameCodesLength + playerIdsLength])
+    offset += gameCodesLength + playerIdsLength
+    gameCodes = data[offset:offset + codesLength].decode().split('\0') if count else []
+    offset += codesLength
+
+    lengths, offset = _array('I', data, offset, count)
+    kinds, offset = _array('B', data, offset, count)
+    deadlines, offset = _array('d', data, offset, count)
+    shifts, offset = _array('d', data, offset, count)
+    ends = list(accumulate(lengths, initial=offset))
+    frozen = [data[start:end] for start, end in zip(ends, ends[1:])]
+    return {'drainedAt': drainedAt, 'journalSegment': segment, 'journalSeq': seq, 'codes': codes,
+            'games': DrainedGames(gameCodes, frozen, list(map(KINDS.__getitem__, kinds)), deadlines, shifts)}
@@ -0,0 +1,1357 @@
+import gc, os, json, time, random, logging, secrets, itertools, threading, contextlib, collections
+from array import array
+from scheduler import GameScheduler
+from board import iter_bits
+from batch import resolve_batch
+from geometry import LAYOUTS, DEFAULT_LAYOUT, get_geometry
+from codes import CodeAllocator
+from journal import Journal
+from archive import Archive
+from drain import DrainedGames, write_drain, read_drain
+from state import GameState, encode_move, decode_move, place_fortresses, frozen_clocks, frozen_players
+from wire import FORMATS, binary_room, encode_snapshot, encode_delta, encode_move_preview
+import metrics
+
+# Game state and rules shared by the Flask server (app.py) and the asyncio
+# server (asgi.py). Request handlers return (body, status) and leave sending
+# responses and socket events to the server that called them.
+
+# Active games storage
+activeGames = {}
+
+# Unique game codes and player ids, recycled when games are removed
+gameCodes = CodeAllocator()
+playerIds = CodeAllocator()
+
+# Tick and lobby-expiry deadlines, so the game loop only touches games that are due
+scheduler = GameScheduler()
+
+# Every change to what /game/sync returns takes the next number, so ETags stay
+# unique even after a game code is reused; the prefix keeps them unique across
+# restarts, which now keep their games
+stateVersions = itertools.count(1)
+ETAG_PREFIX = '%x' % int(time.time() * 1000)
+
+# Crash-recovery journal of every create, join, move, tick and removal; see open_journal()
+journal = None
+
+# On-disk store of finished games' results once they leave memory; see open_archive()
+archive = None
+
+# Codes of finished games still in memory, so /game/active can leave them out
+finishedGames = set()
+
+# gameCode -> GameState.freeze() bytes of games that sat idle; see hibernate_games().
+# A game is in activeGames or here, never both, and hibernationLock guards moving
+# it from one to the other.
+hibernatedGames = {}
+hibernationLock = threading.Lock()
+
+# gameCode -> seconds to move a hibernated game's clocks on by when it thaws, for
+# games restored from a drain file that haven't woken since
+clockShifts = {}
+
+# Set by drain_games() when the server is stopping: no new games, joins, moves or ticks
+draining = False
+
+# gameCode -> callbacks to run on that game's next state change (long-polling syncs)
+stateWatchers = {}
+stateWatchersLock = threading.Lock()
+
+# Longest a /game/sync long poll is held, in seconds
+LONG_POLL_MAX = 30
+
+# Unstarted games are removed after this many seconds
+LOBBY_TIMEOUT = 600
+
+# Finished games stay in memory this many seconds after their last round, then
+# are archived and evicted; /game/sync keeps serving them from the archive
+GAME_RETENTION = float(os.environ.get('GAME_RETENTION', 300))
+
+# Games no request has touched for this many seconds are frozen to bytes until the
+# next request for them; started games only while their next round is at least as
+# far off
+HIBERNATE_AFTER = float(os.environ.get('HIBERNATE_AFTER', 30))
+
+# Quick-match queues: one FIFO of waiting tickets per (layout, tickPolicy, tickInterval).
+# Dropped tickets stay in their queue until they reach the front, so every queue
+# operation is O(1); a queue is deleted once nothing live is left at its front.
+quickmatchQueues = {}
+quickmatchTickets = {}  # ticketId -> ticket still waiting
+quickmatchBySid = {}    # socket id -> ticketId of its waiting ticket
+quickmatchLock = threading.Lock()
+
+# Queued players are dropped after waiting this many seconds for an opponent
+QUICKMATCH_TIMEOUT = 120
+
+# Rounds resolve every tickInterval seconds under the 'fixed' policy; under 'early'
+# they also resolve as soon as both sides have queued a move
+TICK_POLICIES = ('fixed', 'early')
+TICK_INTERVAL = 5
+MIN_TICK_INTERVAL = 1
+MAX_TICK_INTERVAL = 60
+
+# A game in play ends once rounds have passed without a move for longer than this
+INACTIVITY_TIMEOUT = 60
+
+# Combat rules: defending stacks a cell's strength up to DEFENSE_CAP, and a claim
+# neutralizes each adjacent strength-1 enemy cell with NEUTRALIZE_CHANCE
+DEFENSE_CAP = 2
+NEUTRALIZE_CHANCE = 0.5
+
+# Ticks with at least this many due games are resolved by the vectorized batch engine
+BATCH_MIN_GAMES = 256
+
+# Cross-check incremental board counters against full scans (slow, for debugging)
+DEBUG_COUNTERS = os.environ.get('DEBUG_COUNTERS') == '1'
+
+# Metrics served on /metrics
+TICK_DURATION = metrics.Histogram(
+    'game_tick_duration_seconds', 'Time to resolve every game due on one tick and queue its broadcasts')
+TICK_GAMES = metrics.Histogram(
+    'game_tick_games', 'Games resolved per tick', buckets=(1, 10, 100, 1000, 10000, 100000))
+TICK_LAG = metrics.Histogram(
+    'game_tick_lag_seconds', 'Delay between a game\'s nextUpdateTime and its resolution')
+EARLY_TICKS = metrics.Counter('early_ticks', 'Rounds moved up because both sides had moved under the early policy')
+EMIT_DURATION = metrics.Histogram(
+    'socket_emit_duration_seconds', 'Time spent broadcasting one event to a room', labels=('event',))
+REQUEST_DURATION = metrics.Histogram(
+    'http_request_duration_seconds', 'HTTP request latency', labels=('route', 'method', 'status'))
+SOCKET_CONNECTIONS = metrics.Gauge('socket_connections', 'Connected Socket.IO clients')
+GAMES = metrics.Gauge('games', 'Games in memory by state, not counting hibernated ones', labels=('state',))
+HIBERNATED = metrics.Gauge('games_hibernated', 'Idle games held as frozen bytes')
+HIBERNATED_BYTES = metrics.Gauge('games_hibernated_bytes', 'Size of the frozen bytes of every hibernated game')
+WAKE_DURATION = metrics.Histogram(
+    'game_wake_duration_seconds', 'Time to thaw a hibernated game',
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01))
+SNAPSHOT_CACHE = metrics.Counter(
+    'snapshot_cache_lookups', 'Game snapshot lookups by encoding; misses are encodes', labels=('encoding', 'result'))
+QUICKMATCH_WAIT = metrics.Histogram(
+    'quickmatch_wait_seconds', 'Time a queued player waited for a quick-match opponent',
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+QUICKMATCH_QUEUED = metrics.Gauge('quickmatch_queued', 'Players waiting for a quick match')
+QUICKMATCH_DROPPED = metrics.Counter(
+    'quickmatch_dropped', 'Queued players who left before being matched', labels=('reason',))
+CODE_OCCUPANCY = metrics.Gauge(
+    'code_space_occupancy', 'Fraction of 4-letter codes in use; codes grow longer past 0.5', labels=('kind',))
+
+# Compile the default layout up front so the first game doesn't pay for it
+get_geometry(DEFAULT_LAYOUT)
+
+def check_win_condition(board):
+    """Check if either player has won the game"""
+    if DEBUG_COUNTERS:
+        board.verify_counters()
+
+    # A side loses once it owns no cells (values 1/2 for host, -1/-2 for player)
+    if not board.host_cells:
+        return 'player'
+    elif not board.player_cells:
+        return 'host'
+
+    return None  # No winner yet
+
+def game_snapshot(game):
+    """Full game state sent on sync, join and when a client reports a version gap"""
+    return {
+        'board': game.board_list(),
+        'version': game.version,
+        'nextUpdateTime': game.nextUpdateTime,
+        'pendingMoves': {
+            'host': decode_move(game.hostMove),
+            'player': decode_move(game.playerMove)
+        },
+        'gameOver': game.gameOver,
+        'winner': game.winner
+    }
+
+def cached_snapshot(game, encoding='dict'):
+    """Game snapshot in one encoding, built at most once per state change
+
+    'dict' is the game_snapshot() payload for socket replies, 'json' its
+    encoded bytes for /game/sync and 'binary' the wire.encode_snapshot()
+    bytes. Entries are keyed by stateVersion, so touch_state() invalidates
+    them all.
+    """
+    stateVersion = game.stateVersion
+    cache = game.snapshotCache
+    if cache is None or cache['stateVersion'] != stateVersion:
+        cache = game.snapshotCache = {'stateVersion': stateVersion}
+
+    value = cache.get(encoding)
+    if value is not None:
+        SNAPSHOT_CACHE.labels(encoding, 'hit').inc()
+        return value
+
+    # Build under the game lock so a tick can't change the board halfway through
+    SNAPSHOT_CACHE.labels(encoding, 'miss').inc()
+    with game.lock:
+        if encoding == 'binary':
+            value = encode_snapshot(game)
+        elif encoding == 'json':
+            value = json.dumps(cached_snapshot(game), separators=(',', ':')).encode()
+        else:
+            value = game_snapshot(game)
+    cache[encoding] = value
+    return value
+
+def state_etag(game):
+    """ETag for the game's current /game/sync response"""
+    return '"%s-%d"' % (ETAG_PREFIX, game.stateVersion)
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value covers etag"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        # If-None-Match uses weak comparison, so W/"n" matches "n"
+        if tag == '*' or tag.removeprefix('W/') == etag:
+            return True
+    return False
+
+def record(gameCode, game, kind, *fields):
+    """Journal an event for a game; call with the game's lock held so events stay in order"""
+    if journal is not None:
+        game.journalSeq = journal.append(kind, gameCode, *fields)
+
+def touch_state(gameCode, game):
+    """Record a change to a game's synced state and wake anyone long-polling it"""
+    game.stateVersion = next(stateVersions)
+    game.snapshotCache = None
+    wake_watchers(gameCode)
+
+def wake_watchers(gameCode):
+    with stateWatchersLock:
+        callbacks = stateWatchers.pop(gameCode, ())
+    for callback in callbacks:
+        callback()
+
+def watch_state(gameCode, if_none_match, callback):
+    """Run callback on the game's next state change
+
+    Returns False without registering when the game is gone or its state
+    already differs from if_none_match, so the caller can reply right away.
+    """
+    with stateWatchersLock:
+        stateWatchers.setdefault(gameCode, set()).add(callback)
+    game = get_game(gameCode)
+    if game is None or not etag_matches(if_none_match, state_etag(game)):
+        unwatch_state(gameCode, callback)
+        return False
+    return True
+
+def unwatch_state(gameCode, callback):
+    """Drop a callback registered with watch_state, e.g. when a long poll times out"""
+    with stateWatchersLock:
+        callbacks = stateWatchers.get(gameCode)
+        if callbacks is not None:
+            callbacks.discard(callback)
+            if not callbacks:
+                del stateWatchers[gameCode]
+
+def long_poll_timeout(data):
+    """Seconds a /game/sync request asked to wait for a change, capped at LONG_POLL_MAX"""
+    try:
+        wait = float(data.get('wait', 0))
+    except (TypeError, ValueError):
+        return 0
+    return max(0, min(wait, LONG_POLL_MAX))
+
+def count_games_by_state():
+    """Games in memory per state, computed when /metrics is scraped"""
+    counts = {('unstarted',): 0, ('active',): 0, ('finished',): 0}
+    for game in list(activeGames.values()):
+        if game.gameOver:
+            counts[('finished',)] += 1
+        elif game.startTime == -1:
+            counts[('unstarted',)] += 1
+        else:
+            counts[('active',)] += 1
+    return counts
+
+GAMES.set_function(count_games_by_state)
+HIBERNATED.set_function(lambda: len(hibernatedGames))
+QUICKMATCH_QUEUED.set_function(lambda: len(quickmatchTickets))
+CODE_OCCUPANCY.set_function(lambda: {
+    ('game',): gameCodes.occupancy(),
+    ('player',): playerIds.occupancy()
+})
+
+def count_active_games():
+    """Return count of active games: lobbies and games in play, but not finished ones awaiting archival"""
+    return {'count': len(activeGames) + len(hibernatedGames) - len(finishedGames)}, 200
+
+def round_rng(game):
+    """A generator seeded from the game's seed and version for the round being resolved
+
+    Seeding per round means a round replays from the seed alone, with no
+    generator state to journal or snapshot, and nothing to keep between
+    rounds: the generator is dropped once the round is resolved. Only rounds
+    that roll call this.
+    """
+    return random.Random(game.version << 64 | game.seed)
+
+def new_game(hostId, playerId, layout, board, creationTime, seed, tickPolicy='fixed', tickInterval=TICK_INTERVAL):
+    """State of a freshly created, unstarted game; board may be None to build it from the seed when needed"""
+    return GameState(hostId, playerId, layout, board, creationTime, seed, tickPolicy, tickInterval,
+                     next(stateVersions), threading.RLock())
+
+def game_options(data):
+    """Validated (layout, tickPolicy, tickInterval) from a request, or (None, error message)"""
+    layout = data.get('layout', DEFAULT_LAYOUT)
+    if layout not in LAYOUTS:
+        return None, 'Unknown layout'
+    tickPolicy = data.get('tickPolicy', 'fixed')
+    if tickPolicy not in TICK_POLICIES:
+        return None, 'Unknown tick policy'
+    tickInterval = data.get('tickInterval', TICK_INTERVAL)
+    if (not isinstance(tickInterval, (int, float)) or isinstance(tickInterval, bool)
+            or not MIN_TICK_INTERVAL <= tickInterval <= MAX_TICK_INTERVAL):
+        return None, 'Tick interval must be %d-%d seconds' % (MIN_TICK_INTERVAL, MAX_TICK_INTERVAL)
+    return (layout, tickPolicy, tickInterval), None
+
+def open_game(layout, tickPolicy, tickInterval):
+    """Set up a new unstarted game with random fortresses; returns (gameCode, game), or (None, None) while draining"""
+    # Generate game code and player IDs
+    gameCode = gameCodes.allocate()
+    hostId = playerIds.allocate()
+    playerId = playerIds.allocate()
+
+    # Every random choice in the game derives from its seed, so it can be replayed exactly
+    seed = random.getrandbits(64)
+
+    # Create a copy of the empty board
+    board = get_geometry(layout).empty_board.copy()
+    host_pos, player_pos = place_fortresses(board, seed)
+    board.take_changes()  # Clients start from the full board, not a delta
+
+    # Set up game state
+    creationTime = time.time()
+    game = new_game(hostId, playerId, layout, board, creationTime, seed, tickPolicy, tickInterval)
+    with hibernationLock:
+        # A drain lists the games under this lock, so none can be added behind its back
+        if draining:
+            gameCodes.release(gameCode)
+            playerIds.release(hostId)
+            playerIds.release(playerId)
+            return None, None
+        record(gameCode, game, 'create', hostId, playerId, layout, creationTime, seed, host_pos, player_pos,
+               tickPolicy, tickInterval)
+        activeGames[gameCode] = game
+    scheduler.schedule(gameCode, 'hibernate', creationTime + HIBERNATE_AFTER)
+    return gameCode, game
+
+def create_game(data):
+    """Create a new game with initial fortresses"""
+    options, error = game_options(data)
+    if error:
+        return {'error': error}, 400
+
+    gameCode, game = open_game(*options)
+    if gameCode is None:
+        return {'error': 'Server is shutting down'}, 503
+    scheduler.schedule(gameCode, 'expire', game.creationTime + LOBBY_TIMEOUT)
+
+    body = {
+        'gameCode': gameCode,
+        'hostId': game.hostId,
+        'playerId': game.playerId,
+        'board': game.board.to_list(),
+        'layout': game.geometry,
+        'tickPolicy': game.tickPolicy,
+        'tickInterval': game.tickInterval,
+        'nextUpdateTime': game.nextUpdateTime
+    }
+    # Most lobbies wait a while for an opponent; keep them small until one joins
+    game.park()
+    return body, 200
+
+def synchronize(data, if_none_match=None):
+    """Synchronize game state
+
+    Returns (body, status, etag). A 200 body is the JSON-encoded snapshot as
+    bytes, shared by every reader until the state changes; when
+    if_none_match already covers the current state the status is 304 and
+    the body is None.
+    """
+    gameCode = data.get('gameCode')
+
+    game = get_game(gameCode)
+    if game is None:
+        return archived_sync(gameCode, if_none_match)
+
+    etag = state_etag(game)
+
+    # Nothing changed since the client's copy, so skip building the snapshot
+    if etag_matches(if_none_match, etag):
+        return None, 304, etag
+
+    return cached_snapshot(game, 'json'), 200, etag
+
+def archived_sync(gameCode, if_none_match):
+    """synchronize() for a game that has left memory, answered from the archive"""
+    saved = archive.load(gameCode) if archive is not None and gameCode else None
+    if saved is None:
+        return {'error': 'Game not found'}, 404, None
+
+    etag = saved['etag']
+    if etag_matches(if_none_match, etag):
+        return None, 304, etag
+
+    valid = get_geometry(saved['layout']).empty_board.valid
+    body = {
+        'board': [value if valid >> idx & 1 else None
+                  for idx, value in enumerate(array('b', saved['cells']))],
+        'version': saved['version'],
+        'nextUpdateTime': saved['nextUpdateTime'],
+        'pendingMoves': {'host': None, 'player': None},
+        'gameOver': True,
+        'winner': saved['winner']
+    }
+    return json.dumps(body, separators=(',', ':')).encode(), 200, etag
+
+def join_game(data):
+    """Join an existing game"""
+    gameCode = data.get('gameCode')
+
+    game = get_game(gameCode)
+    if game is None:
+        return {'error': 'Game not found'}, 404
+
+    # Mark game as started
+    with game.lock:
+        # The game may have been removed while we waited for the lock
+        if activeGames.get(gameCode) is not game:
+            return {'error': 'Game not found'}, 404
+        # Only one player may take the second seat
+        if game.startTime != -1:
+            return {'error': 'Game already started'}, 409
+        if draining:
+            return {'error': 'Server is shutting down'}, 503
+        start_game(gameCode, game)
+
+        return {
+            'playerId': game.playerId,
+            'board': game.board.to_list(),
+            'nextUpdateTime': game.nextUpdateTime
+        }, 200
+
+def start_game(gameCode, game):
+    """Mark a game started and begin ticking; call with the game's lock held"""
+    game.startTime = time.time()
+    record(gameCode, game, 'join', game.startTime)
+
+    # Start ticking; the lobby no longer needs to expire
+    scheduler.cancel(gameCode, 'expire')
+    if not game.gameOver:
+        schedule_tick(gameCode, game)
+
+def quickmatch(sid, data, is_connected):
+    """Handle quickmatch from the socket sid: pair it with the longest-waiting player who asked for the same options
+
+    data holds optional 'layout', 'tickPolicy' and 'tickInterval'. The
+    ticket belongs to the socket that sent the event, so nobody can queue
+    someone else's socket. Returns (reply event, reply payload, messages for
+    other sockets). With an opponent waiting the reply is 'matched' with the
+    caller's seat in a new game that has already started, and the opponent
+    gets its own 'matched'; otherwise it is 'quickmatch_queued' with a
+    'ticket'. is_connected(sid) tells whether a socket is still connected.
+    """
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return 'error', {'message': 'Quick-match options must be an object'}, []
+    options, error = game_options(data)
+    if error:
+        return 'error', {'message': error}, []
+    # Whole seconds only, so clients can't open a queue for every possible interval
+    if options[2] != int(options[2]):
+        return 'error', {'message': 'Quick-match tick interval must be a whole number of seconds'}, []
+    if draining:
+        return 'error', {'message': 'Server is shutting down'}, []
+
+    now = time.time()
+    with quickmatchLock:
+        # Asking again while queued keeps the original place in line
+        ticketId = quickmatchBySid.get(sid)
+        if ticketId is not None:
+            return 'quickmatch_queued', {'ticket': ticketId}, []
+
+        queue = quickmatchQueues.get(options, ())
+        opponent = None
+        while queue and opponent is None:
+            ticket = queue.popleft()
+            if quickmatchTickets.get(ticket['ticketId']) is not ticket:
+                continue  # Cancelled or expired while queued
+            drop_ticket(ticket)
+            if is_connected(ticket['sid']):
+                opponent = ticket
+            else:
+                QUICKMATCH_DROPPED.labels('disconnect').inc()
+
+        if opponent is None:
+            ticket = {'ticketId': 'q' + secrets.token_urlsafe(9), 'sid': sid, 'options': options, 'queuedAt': now}
+            quickmatchQueues.setdefault(options, collections.deque()).append(ticket)
+            quickmatchTickets[ticket['ticketId']] = ticket
+            quickmatchBySid[sid] = ticket['ticketId']
+            scheduler.schedule(ticket['ticketId'], 'quickmatch', now + QUICKMATCH_TIMEOUT)
+            return 'quickmatch_queued', {'ticket': ticket['ticketId']}, []
+
+    QUICKMATCH_WAIT.observe(now - opponent['queuedAt'])
+    scheduler.cancel(opponent['ticketId'])
+
+    # The longest-waiting player hosts; the game starts straight away
+    gameCode, game = open_game(*options)
+    if gameCode is None:
+        return 'error', {'message': 'Server is shutting down'}, []
+    with game.lock:
+        start_game(gameCode, game)
+        host, player = (seat_details(gameCode, game, playerType) for playerType in ('host', 'player'))
+    return 'matched', player, [('matched', host, opponent['sid'])]
+
+def seat_details(gameCode, game, playerType):
+    """What a quick-matched player needs to play their seat"""
+    return {
+        'gameCode': gameCode,
+        'playerType': playerType,
+        'playerId': game.hostId if playerType == 'host' else game.playerId,
+        'board': game.board.to_list(),
+        'layout': game.geometry,
+        'tickPolicy': game.tickPolicy,
+        'tickInterval': game.tickInterval,
+        'nextUpdateTime': game.nextUpdateTime
+    }
+
+def drop_ticket(ticket):
+    """Forget a waiting ticket; its queue entry is skipped when it reaches the front"""
+    del quickmatchTickets[ticket['ticketId']]
+    if quickmatchBySid.get(ticket['sid']) == ticket['ticketId']:
+        del quickmatchBySid[ticket['sid']]
+    trim_queue(ticket['options'])
+
+def trim_queue(options):
+    """Pop dropped tickets off the front of a quick-match queue, deleting it once it is empty"""
+    queue = quickmatchQueues.get(options)
+    if queue is None:
+        return
+    while queue and quickmatchTickets.get(queue[0]['ticketId']) is not queue[0]:
+        queue.popleft()
+    if not queue:
+        del quickmatchQueues[options]
+
+def cancel_quickmatch(sid):
+    """Handle cancel_quickmatch from the socket sid; returns (reply event, reply payload)"""
+    ticket = leave_quickmatch(sid, 'cancel')
+    if ticket is None:
+        return 'error', {'message': 'Not in the quick-match queue'}
+    return 'quickmatch_cancelled', {'ticket': ticket['ticketId']}
+
+def leave_quickmatch(sid, reason='disconnect'):
+    """Drop a socket's place in the quick-match queue; returns its ticket, or None if it had none"""
+    with quickmatchLock:
+        ticket = quickmatchTickets.get(quickmatchBySid.get(sid))
+        if ticket is None:
+            return None
+        drop_ticket(ticket)
+    scheduler.cancel(ticket['ticketId'])
+    QUICKMATCH_DROPPED.labels(reason).inc()
+    return ticket
+
+def expire_ticket(ticketId, outbox):
+    """Drop a ticket that waited QUICKMATCH_TIMEOUT without a match and tell its socket"""
+    with quickmatchLock:
+        ticket = quickmatchTickets.get(ticketId)
+        if ticket is None:
+            return
+        drop_ticket(ticket)
+    QUICKMATCH_DROPPED.labels('timeout').inc()
+    outbox.append(('quickmatch_timeout', {
+        'ticket': ticketId,
+        'message': 'No opponent found'
+    }, ticket['sid']))
+
+def make_move(data, has_clients):
+    """Process a player move
+
+    Returns (body, status, messages) where messages are the (event, payload,
+    room) move previews to broadcast; has_clients(room) tells whether anyone
+    listens on a room.
+    """
+    gameCode = data.get('gameCode')
+    playerId = data.get('playerId')
+    index = data.get('index')  # Flat index of the cell
+    moveType = data.get('moveType')  # 'claim' or 'defend'
+
+    game = get_game(gameCode)
+    if game is None:
+        return {'error': 'Game not found'}, 404, []
+
+    # Moves and ticks on one game are serialized by its lock; other games are unaffected
+    with game.lock:
+        # The game may have been removed while we waited for the lock
+        if activeGames.get(gameCode) is not game:
+            return {'error': 'Game not found'}, 404, []
+        # A drain may already have written this game out; the move would be lost
+        if draining:
+            return {'error': 'Server is shutting down'}, 503, []
+
+        # Check if game is over
+        if game.gameOver:
+            return {'error': 'Game is over'}, 400, []
+
+        # Verify player identity
+        if playerId not in [game.hostId, game.playerId]:
+            return {'error': 'Unauthorized player'}, 403, []
+
+        # Determine player type and symbol
+        playerType = 'host' if playerId == game.hostId else 'player'
+        playerSymbol = 1 if playerType == 'host' else -1
+
+        board = game.board
+        if DEBUG_COUNTERS:
+            board.verify_counters()
+        if not is_legal_move(board, playerSymbol, index, moveType):
+            return {'error': move_error(board, playerSymbol, index, moveType)}, 400, []
+
+        # Store the move
+        move = encode_move(index, moveType)
+        if playerType == 'host':
+            game.hostMove = move
+        else:
+            game.playerMove = move
+        record(gameCode, game, 'move', playerType, index, moveType)
+        if game.startTime != -1 and tick_ready(game):
+            # Both sides are in; resolve the round now instead of at the interval
+            EARLY_TICKS.inc()
+            schedule_tick(gameCode, game)
+        touch_state(gameCode, game)
+
+        # Broadcast move preview to all clients in the game room
+        messages = [('move_preview', {
+            'playerType': playerType,
+            'move': {'index': index, 'type': moveType}
+        }, gameCode)]
+        if has_clients(binary_room(gameCode)):
+            messages.append(('move_preview', encode_move_preview(game), binary_room(gameCode)))
+
+        return {
+            'message': 'Move queued',
+            'nextUpdateTime': game.nextUpdateTime
+        }, 200, messages
+
+def tick_ready(game):
+    """Whether the game's policy resolves its round before the interval is up"""
+    return game.tickPolicy == 'early' and game.hostMove is not None and game.playerMove is not None
+
+def schedule_tick(gameCode, game):
+    """Schedule the game's next round: now if it's ready early, otherwise at nextUpdateTime"""
+    if tick_ready(game):
+        game.nextUpdateTime = min(game.nextUpdateTime, time.time())
+    scheduler.schedule(gameCode, 'tick', game.nextUpdateTime)
+
+def is_legal_move(board, playerSymbol, index, moveType):
+    """Whether the side playing playerSymbol may make this move now"""
+    # Each side's legal cells are kept up to date by the board, so validation is one lookup
+    return isinstance(index, int) and 0 <= index < len(board) and board.legal(playerSymbol, moveType) >> index & 1
+
+def move_error(board, playerSymbol, index, moveType):
+    """Explain why a move is not in the legal set"""
+    if not isinstance(index, int) or index < 0 or index >= len(board):
+        return 'Invalid position'
+
+    # Cell must exist
+    if board[index] is None:
+        return 'Invalid cell'
+
+    if moveType == 'claim':
+        if board[index] != 0:
+            return 'Cell already claimed'
+        return 'Must be adjacent to friendly territory'
+
+    if moveType == 'defend':
+        return 'Can only defend your own territory'
+
+    return 'Unknown move type'
+
+def legal_moves(data):
+    """Cells each side can currently claim or defend"""
+    gameCode = data.get('gameCode')
+
+    game = get_game(gameCode)
+    if game is None:
+        return {'error': 'Game not found'}, 404
+
+    # Finished games accept no moves
+    sides = {}
+    with game.lock:
+        board = game.board
+        for playerType, symbol in (('host', 1), ('player', -1)):
+            sides[playerType] = {
+                'claim': [] if game.gameOver else list(iter_bits(board.claimable(symbol))),
+                'defend': [] if game.gameOver else list(iter_bits(board.owned(symbol)))
+            }
+        version = game.version
+
+    return {'version': version, **sides}, 200
+
+def join_socket(data):
+    """Handle join_game; returns (room to join or None, reply event, reply payload)"""
+    gameCode = data.get('gameCode')
+    wireFormat = data.get('format', 'json')  # 'binary' opts in to the compact encoding
+
+    if wireFormat not in FORMATS:
+        return None, 'error', {'message': 'Unknown format'}
+
+    game = get_game(gameCode)
+    if game is None:
+        return None, 'error', {'message': 'Game not found'}
+
+    # Join the socket room for this game and encoding
+    if wireFormat == 'binary':
+        return binary_room(gameCode), 'joined', cached_snapshot(game, 'binary')
+
+    return gameCode, 'joined', {
+        'message': 'Successfully joined game room',
+        'gameCode': gameCode,
+        **cached_snapshot(game)
+    }
+
+def snapshot_reply(data):
+    """Handle request_snapshot from a client that missed a game_update delta"""
+    gameCode = data.get('gameCode')
+
+    game = get_game(gameCode)
+    if game is None:
+        return 'error', {'message': 'Game not found'}
+
+    if data.get('format') == 'binary':
+        return 'game_snapshot', cached_snapshot(game, 'binary')
+
+    return 'game_snapshot', {
+        'gameCode': gameCode,
+        **cached_snapshot(game)
+    }
+
+def legal_moves_reply(data):
+    """Handle request_legal_moves; returns (reply event, reply payload)"""
+    body, status = legal_moves(data)
+    if status != 200:
+        return 'error', {'message': body['error']}
+    return 'legal_moves', body
+
+def process_moves(game):
+    """Process the queued moves for a game"""
+    board = game.board
+    adjacency_masks = get_geometry(game.geometry).adjacency_masks
+    moves_made = False
+    rng = None
+
+    # Process both players' moves
+    for move_type, move in [('host', game.hostMove), ('player', game.playerMove)]:
+        if move is None:
+            continue
+
+        moves_made = True
+        index = move >> 1
+        move_action = 'defend' if move & 1 else 'claim'
+        player_symbol = 1 if move_type == 'host' else -1
+
+        # Apply the move
+        if move_action == 'claim':
+            board[index] = player_symbol
+        elif move_action == 'defend':
+            # Increment/decrement defense value
+            current_value = board[index]
+            if player_symbol > 0:  # Host
+                board[index] = min(DEFENSE_CAP, current_value + 1)
+            else:  # Player
+                board[index] = max(-DEFENSE_CAP, current_value - 1)
+
+        # Process combat effects on adjacent enemy tiles
+        for adj_idx in iter_bits(adjacency_masks[index] & board.owned(-player_symbol)):
+            adj_value = board[adj_idx]
+            # Combat between opposing territories
+            if move_action == 'claim' and abs(adj_value) == 1:
+                # Chance to neutralize enemy territory
+                if rng is None:
+                    rng = round_rng(game)
+                if rng.random() < NEUTRALIZE_CHANCE:
+                    board[adj_idx] = 0
+            elif move_action == 'defend' and abs(adj_value) == 1:
+                # Defending applies pressure based on strength
+                friendly_pressure = abs(board[index])
+                enemy_pressure = abs(adj_value)
+                if friendly_pressure > enemy_pressure:
+                    board[adj_idx] = 0
+
+    # Clear moves after processing
+    game.hostMove = None
+    game.playerMove = None
+
+    if DEBUG_COUNTERS:
+        board.verify_counters()
+
+    return moves_made
+
+def remove_game(gameCode):
+    """Remove a game from memory along with its pending deadlines, freeing its codes"""
+    game = get_game(gameCode, touch=False)
+    if game is None:
+        return None
+    # Requests already holding the game see it's gone once they get the lock
+    with game.lock:
+        if activeGames.get(gameCode) is not game:
+            return None
+        scheduler.cancel(gameCode)
+        record(gameCode, game, 'remove')
+        del activeGames[gameCode]
+        finishedGames.discard(gameCode)
+        gameCodes.release(gameCode)
+        playerIds.release(game.hostId)
+        playerIds.release(game.playerId)
+        wake_watchers(gameCode)  # Long polls on this game now answer 404
+    return game
+
+def resolve_games(games):
+    """Resolve queued moves for every due game, batching them when there are many"""
+    # Batches are stacked per layout since boards of different shapes can't share an array
+    by_layout = {}
+    for pos, game in enumerate(games):
+        by_layout.setdefault(game.geometry, []).append(pos)
+
+    moves_made = [False] * len(games)
+    for layout, positions in by_layout.items():
+        group = [games[pos] for pos in positions]
+        if len(group) >= BATCH_MIN_GAMES:
+            results = resolve_batch(group, get_geometry(layout).adjacency_index, round_rng,
+                                    DEFENSE_CAP, NEUTRALIZE_CHANCE)
+            if DEBUG_COUNTERS:
+                for game in group:
+                    game.board.verify_counters()
+        else:
+            results = [process_moves(game) for game in group]
+        for pos, made in zip(positions, results):
+            moves_made[pos] = made
+    return moves_made
+
+def finish_tick(gameCode, game, moves_made, current_time, outbox, has_clients):
+    """Schedule the next round of a resolved game and queue its broadcasts in outbox"""
+    # Set next update time one interval from now
+    game.nextUpdateTime = current_time + game.tickInterval
+
+    # Check for winner
+    winner = check_win_condition(game.board)
+    if winner:
+        game.gameOver = True
+        game.winner = winner
+        finishedGames.add(gameCode)
+
+    # Send only the cells that changed this round to all clients in the game room
+    game.version += 1
+    touch_state(gameCode, game)
+    changes = game.board.take_changes()
+    outbox.append(('game_update', {
+        'version': game.version,
+        'changes': changes,
+        'nextUpdateTime': game.nextUpdateTime,
+        'pendingMoves': {
+            'host': decode_move(game.hostMove),
+            'player': decode_move(game.playerMove)
+        },
+        'gameOver': game.gameOver,
+        'winner': game.winner
+    }, gameCode))
+    if has_clients(binary_room(gameCode)):
+        outbox.append(('game_update', encode_delta(game, changes), binary_room(gameCode)))
+
+    timedOut = track_inactivity(game, moves_made)
+    record(gameCode, game, 'tick', game.version, game.nextUpdateTime, changes,
+           game.timeout, game.gameOver, game.winner)
+
+    # End inactive games
+    if timedOut:
+        outbox.append(('game_timeout', {
+            'message': 'Game ended due to inactivity'
+        }, [gameCode, binary_room(gameCode)]))
+        remove_game(gameCode)
+    elif game.gameOver:
+        scheduler.schedule(gameCode, 'archive', archive_deadline(game))
+    else:
+        scheduler.schedule(gameCode, 'tick', game.nextUpdateTime)
+
+def track_inactivity(game, moves_made):
+    """Count a resolved round towards the game's inactivity; True once it has gone INACTIVITY_TIMEOUT without a move"""
+    game.timeout = 0 if moves_made else game.timeout + 1
+    return game.timeout * game.tickInterval > INACTIVITY_TIMEOUT
+
+def archive_deadline(game):
+    """When a finished game leaves memory: GAME_RETENTION seconds after its last round"""
+    return game.nextUpdateTime - game.tickInterval + GAME_RETENTION
+
+def archive_games(gameCodes):
+    """Write finished games to the archive in one transaction, then evict them from memory
+
+    Games are evicted only after the write, so /game/sync always finds a
+    finished game in one place or the other; if the write fails they stay
+    in memory for another retention window. Without an archive they are
+    just evicted.
+    """
+    finished = []
+    for gameCode in gameCodes:
+        game = get_game(gameCode, touch=False)
+        if game is None:
+            continue
+        with game.lock:
+            if activeGames.get(gameCode) is game and game.gameOver:
+                finished.append((gameCode, game.geometry, game.board.cells.tobytes(), game.version,
+                                 game.winner, game.nextUpdateTime, state_etag(game)))
+    if archive is not None and finished and not archive.store(finished):
+        for row in finished:
+            scheduler.schedule(row[0], 'archive', time.time() + GAME_RETENTION)
+        return
+    for row in finished:
+        remove_game(row[0])
+
+def get_game(gameCode, touch=True):
+    """The game with this code, thawed first if it is hibernating; None if there is none
+
+    Requests touch the game, which keeps it awake for another HIBERNATE_AFTER
+    seconds; ticks, expiry and archival pass touch=False. Awake games are
+    found without hibernationLock: hibernate_games() puts back a game that
+    was touched while it was taking it out, so a game still awake once the
+    touch has landed stays awake.
+    """
+    game = activeGames.get(gameCode)
+    if game is not None:
+        if not touch:
+            return game
+        game.lastTouched = time.time()
+        if activeGames.get(gameCode) is game:
+            return game
+    return wake_game(gameCode, touch)
+
+def wake_game(gameCode, touch):
+    """get_game() for a game that may be hibernating, thawing it outside hibernationLock"""
+    while True:
+        with hibernationLock:
+            game = activeGames.get(gameCode)
+            if game is not None:
+                if touch:
+                    game.lastTouched = time.time()
+                return game
+            frozen = hibernatedGames.get(gameCode)
+            shift = clockShifts.get(gameCode, 0.0)
+        if frozen is None:
+            return None
+
+        start = time.perf_counter()
+        game = GameState.thaw(frozen, threading.RLock(), shift)
+        if shift:
+            # Its clocks changed, and so does its /game/sync response
+            game.stateVersion = next(stateVersions)
+        with hibernationLock:
+            # Woken by someone else, or frozen again, while we thawed
+            if hibernatedGames.get(gameCode) is not frozen:
+                continue
+            del hibernatedGames[gameCode]
+            clockShifts.pop(gameCode, None)
+            activeGames[gameCode] = game
+            if touch:
+                game.lastTouched = time.time()
+            # Back to sleep once idle again; a game woken only to tick is checked right away
+            scheduler.schedule(gameCode, 'hibernate', time.time() + (HIBERNATE_AFTER if touch else 0))
+        WAKE_DURATION.observe(time.perf_counter() - start)
+        HIBERNATED_BYTES.dec(len(frozen))
+        return game
+
+def hibernate_games(gameCodes, current_time):
+    """Freeze each of these games that is still idle, or check it again once it could be"""
+    for gameCode in gameCodes:
+        with hibernationLock:
+            game = activeGames.get(gameCode)
+            if game is None:
+                continue
+            touched = game.lastTouched
+            wake = touched + HIBERNATE_AFTER
+            # A game in play only sleeps if its next round is far enough off
+            if game.startTime != -1 and not game.gameOver and game.nextUpdateTime < current_time + HIBERNATE_AFTER:
+                wake = max(wake, game.nextUpdateTime)
+            if wake > current_time:
+                scheduler.schedule(gameCode, 'hibernate', wake)
+                continue
+            # Skip games a request or tick is using right now
+            if not game.lock.acquire(blocking=False):
+                scheduler.schedule(gameCode, 'hibernate', current_time + 1)
+                continue
+            try:
+                del activeGames[gameCode]
+                # A request that found the game just before it went keeps it awake
+                if game.lastTouched != touched:
+                    activeGames[gameCode] = game
+                    scheduler.schedule(gameCode, 'hibernate', game.lastTouched + HIBERNATE_AFTER)
+                    continue
+                frozen = hibernatedGames[gameCode] = game.freeze()
+            finally:
+                game.lock.release()
+        HIBERNATED_BYTES.inc(len(frozen))
+
+def run_due(current_time, has_clients):
+    """Handle every tick, lobby expiry, archival, hibernation and quick-match timeout that is due
+
+    Returns the broadcasts to send. Nothing runs once a drain has started.
+    """
+    tick_start = time.perf_counter()
+    outbox = []
+
+    # Games stay as the drain writes them; their deadlines are rescheduled on restore
+    if draining:
+        scheduler.pop_due(current_time)
+        return outbox
+
+    # Only games whose deadline has passed are touched
+    due = []
+    finished = []  # Codes of finished games whose retention is over
+    idle = []      # Codes of games to hibernate if nothing has touched them
+    for gameCode, kind in scheduler.pop_due(current_time):
+        if kind == 'quickmatch':
+            # Scheduled under the ticket id rather than a game code
+            expire_ticket(gameCode, outbox)
+            continue
+        elif kind == 'hibernate':
+            idle.append(gameCode)
+            continue
+        elif kind == 'archive':
+            finished.append(gameCode)
+            continue
+
+        game = get_game(gameCode, touch=False)
+        if game is None:
+            continue
+
+        if kind == 'tick':
+            # Games that ended or never started don't tick
+            if game.startTime == -1 or game.gameOver:
+                continue
+            TICK_LAG.observe(current_time - game.nextUpdateTime)
+            due.append((gameCode, game))
+
+        elif kind == 'expire':
+            # Cleanup old unstarted games
+            if game.startTime == -1:
+                remove_game(gameCode)
+
+    # Resolve all due games together, collecting every result into one outbox. Each
+    # game's lock is held from reading its moves until the next round is scheduled,
+    # so a move arriving mid-tick waits and lands in the next round instead of being
+    # cleared unprocessed. Only this loop holds several locks at once, so requests
+    # can't deadlock against it.
+    if due:
+        for _, game in due:
+            game.lock.acquire()
+        try:
+            results = resolve_games([game for _, game in due])
+            for (gameCode, game), moves_made in zip(due, results):
+                finish_tick(gameCode, game, moves_made, current_time, outbox, has_clients)
+        finally:
+            for _, game in due:
+                game.lock.release()
+        TICK_GAMES.observe(len(due))
+        TICK_DURATION.observe(time.perf_counter() - tick_start)
+    if finished:
+        archive_games(finished)
+    # Last, so games that just ticked are judged by their next round
+    if idle:
+        hibernate_games(idle, current_time)
+    return outbox
+
+def game_record(gameCode, game):
+    """Everything needed to rebuild a game after a restart, as a JSON-friendly dict"""
+    return {
+        'gameCode': gameCode,
+        'creationTime': game.creationTime,
+        'startTime': game.startTime,
+        'nextUpdateTime': game.nextUpdateTime,
+        'timeout': game.timeout,
+        'hostId': game.hostId,
+        'playerId': game.playerId,
+        'hostMove': decode_move(game.hostMove),
+        'playerMove': decode_move(game.playerMove),
+        'geometry': game.geometry,
+        'seed': game.seed,
+        'tickPolicy': game.tickPolicy,
+        'tickInterval': game.tickInterval,
+        'board': game.board_list(),
+        'version': game.version,
+        'journalSeq': game.journalSeq,
+        'gameOver': game.gameOver,
+        'winner': game.winner
+    }
+
+def each_game():
+    """Yield (gameCode, game, frozen, shift) for every game, awake or hibernated, without waking any
+
+    An awake game comes with frozen None and its lock held until the next
+    item is asked for; a hibernated one comes with game None and the shift
+    its clocks need when thawed.
+    """
+    with hibernationLock:
+        gameCodes = list(activeGames) + list(hibernatedGames)
+    for gameCode in gameCodes:
+        # Retried if the game is hibernated while we wait for its lock
+        while True:
+            with hibernationLock:
+                game = activeGames.get(gameCode)
+                frozen = hibernatedGames.get(gameCode)
+                shift = clockShifts.get(gameCode, 0.0)
+            if frozen is not None:
+                yield gameCode, None, frozen, shift
+                break
+            if game is None:
+                break  # Removed since the list was taken
+            with game.lock:
+                if activeGames.get(gameCode) is game:
+                    yield gameCode, game, None, 0.0
+                    break
+
+def snapshot_records():
+    """Records of every game for a journal snapshot, each taken under its game's lock
+
+    Hibernated games are recorded from their frozen bytes without waking them.
+    """
+    for gameCode, game, frozen, shift in each_game():
+        yield game_record(gameCode, game if frozen is None else GameState.thaw(frozen, None, shift))
+
+def restore_game(saved):
+    """Rebuild a game from game_record() output; the board starts with no pending changes"""
+    board = get_geometry(saved['geometry']).empty_board.copy()
+    for idx, value in enumerate(saved['board']):
+        if value:
+            board[idx] = value
+    board.take_changes()
+
+    game = new_game(saved['hostId'], saved['playerId'], saved['geometry'], board, saved['creationTime'],
+                    saved['seed'], saved['tickPolicy'], saved['tickInterval'])
+    for key in ('startTime', 'nextUpdateTime', 'timeout', 'version', 'journalSeq', 'gameOver', 'winner'):
+        setattr(game, key, saved[key])
+    for key in ('hostMove', 'playerMove'):
+        move = saved[key]
+        if move is not None:
+            setattr(game, key, encode_move(move['index'], move['type']))
+    return game
+
+def replay_event(event):
+    """Apply one journal event to activeGames, skipping events a snapshot already includes"""
+    seq, kind, gameCode = event[:3]
+    game = activeGames.get(gameCode)
+    if game is not None and game.journalSeq >= seq:
+        return
+
+    if kind == 'create':
+        hostId, playerId, layout, creationTime, seed, host_pos, player_pos, tickPolicy, tickInterval = event[3:]
+        board = get_geometry(layout).empty_board.copy()
+        board[host_pos] = 1
+        board[player_pos] = -1
+        game = activeGames[gameCode] = new_game(hostId, playerId, layout, board, creationTime, seed,
+                                                tickPolicy, tickInterval)
+    elif game is None:
+        return
+    elif kind == 'join':
+        game.startTime = event[3]
+    elif kind == 'move':
+        playerType, index, moveType = event[3:]
+        setattr(game, 'hostMove' if playerType == 'host' else 'playerMove', encode_move(index, moveType))
+    elif kind == 'tick':
+        version, nextUpdateTime, changes, timeout, gameOver, winner = event[3:]
+        board = game.board
+        for idx, value in changes:
+            board[idx] = value
+        game.version = version
+        game.nextUpdateTime = nextUpdateTime
+        game.timeout = timeout
+        game.gameOver = gameOver
+        game.winner = winner
+        game.hostMove = None
+        game.playerMove = None
+    elif kind == 'remove':
+        del activeGames[gameCode]
+        return
+    game.journalSeq = seq
+
+def drain_games(path):
+    """Stop taking new games, joins, moves and ticks, and write every game to path for the next start
+
+    Awake games are frozen under their locks, with raw cells since a fast
+    drain matters more here than a small file; hibernated games are written
+    as they are. Each game's next deadline is written alongside so a restore
+    can schedule it without reading the game. Returns (games written,
+    seconds taken).
+    """
+    global draining
+    start = time.perf_counter()
+    with collector_paused():
+        # Once draining is set no game is created, and a game moving between awake and
+        # hibernated keeps its state either way, so these two lists cover every game
+        with hibernationLock:
+            draining = True
+            awake = list(activeGames.items())
+            asleep = [(gameCode, frozen, clockShifts.get(gameCode, 0.0)) for gameCode, frozen in hibernatedGames.items()]
+        drainedAt = time.time()
+        codes = (gameCodes.dump(), playerIds.dump())
+
+        drained = DrainedGames([], [], [], [], [])
+        written, frozenGames, kinds, deadlines, shifts = drained
+        for gameCode, game in awake:
+            # Waits for a tick already under way, which may also have removed the game
+            with game.lock:
+                if gameCode not in activeGames and gameCode not in hibernatedGames:
+                    continue
+                frozen = game.freeze(compress=False)
+                kind, deadline = next_deadline(game)
+            written.append(gameCode)
+            frozenGames.append(frozen)
+            kinds.append(kind)
+            deadlines.append(deadline)
+            shifts.append(0.0)
+        for gameCode, frozen, shift in asleep:
+            kind, deadline = next_deadline(frozen_clocks(frozen, shift))
+            written.append(gameCode)
+            frozenGames.append(frozen)
+            kinds.append(kind)
+            deadlines.append(deadline)
+            shifts.append(shift)
+        write_drain(path, drainedAt, journal.position() if journal is not None else (0, 0), codes, drained)
+    return len(written), time.perf_counter() - start
+
+@contextlib.contextmanager
+def collector_paused():
+    """Hold off cyclic garbage collection while a drain or restore builds a few hundred thousand objects
+
+    None of them form cycles, and a full collection triggered by the burst
+    would walk every game in memory for nothing.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def next_deadline(game):
+    """(kind, deadline) of the event a game, or the FrozenClocks of one, waits for next"""
+    if game.startTime == -1:
+        return 'expire', game.creationTime + LOBBY_TIMEOUT
+    if game.gameOver:
+        return 'archive', archive_deadline(game)
+    return 'tick', game.nextUpdateTime
+
+def take_drain(path):
+    """The drain file at path as read_drain() returns it, deleting it so it is only restored once"""
+    drained = read_drain(path)
+    if drained is not None:
+        os.remove(path)
+    return drained
+
+def restore_drained(drained):
+    """Bring back drain_games() output as hibernated games, their clocks moved on by the downtime
+
+    Every deadline moves with them, so rounds, lobby expiries and archival
+    pick up where they stopped instead of all falling due at once. The
+    frozen games are kept as they were written, with the shift applied when
+    each one thaws on its first request or tick, so restoring is a few bulk
+    inserts however many games there are.
+    """
+    downtime = max(0.0, time.time() - drained['drainedAt'])
+    restored = drained['games']
+    with collector_paused():
+        hibernatedGames.update(zip(restored.gameCodes, restored.frozen))
+        clockShifts.update(zip(restored.gameCodes, [shift + downtime for shift in restored.shifts]))
+        finishedGames.update(itertools.compress(restored.gameCodes, [kind == 'archive' for kind in restored.kinds]))
+        # A fresh server takes the allocators over whole rather than reserving code by code
+        if not (gameCodes.load(drained['codes'][0]) and playerIds.load(drained['codes'][1])):
+            gameCodes.reserve_many(restored.gameCodes)
+            playerIds.reserve_many(playerId for frozen in restored.frozen for playerId in frozen_players(frozen))
+        scheduler.schedule_many(zip(restored.gameCodes, restored.kinds,
+                                    [deadline + downtime for deadline in restored.deadlines]))
+    HIBERNATED_BYTES.inc(sum(map(len, restored.frozen)))
+    logging.info('Restored %d drained games, moving their clocks on by %.1fs', len(restored.gameCodes), downtime)
+
+def open_drain(path):
+    """Restore the games drain_games() wrote to path, for a server running without a journal
+
+    Returns the number of games restored, 0 if there was no drain file.
+    """
+    drained = take_drain(path)
+    if drained is None:
+        return 0
+    restore_drained(drained)
+    return len(drained['games'].gameCodes)
+
+def open_journal(directory, drain_path=None):
+    """Rebuild activeGames from the journal in directory, then journal every change to it
+
+    Loads the latest snapshot, replays the events after it, reserves the
+    restored codes and reschedules ticks and lobby expiries. If drain_path
+    holds the games drain_games() wrote just before the journal was last
+    closed, they are restored from it instead, much faster and with their
+    clocks moved on, and the journal starts with a snapshot of them.
+    Returns (games restored, events replayed, seconds taken).
+    """
+    global journal
+    start = time.perf_counter()
+    restored = Journal(directory)
+    drained = take_drain(drain_path) if drain_path else None
+    if drained is not None:
+        if restored.resume(drained['journalSegment'], drained['journalSeq']):
+            restore_drained(drained)
+            journal = restored
+            journal.start(snapshot_records)
+            return len(drained['games'].gameCodes), 0, time.perf_counter() - start
+        logging.warning('Ignoring %s: the journal in %s has moved on since it was written', drain_path, directory)
+
+    records, events = restored.recover()
+    for saved in records:
+        activeGames[saved['gameCode']] = restore_game(saved)
+    replayed = 0
+    for event in events:
+        replay_event(event)
+        replayed += 1
+
+    for gameCode, game in activeGames.items():
+        game.board.take_changes()
+        scheduler.schedule(gameCode, 'hibernate', time.time() + HIBERNATE_AFTER)
+        gameCodes.reserve(gameCode)
+        playerIds.reserve(game.hostId)
+        playerIds.reserve(game.playerId)
+        if game.startTime == -1:
+            scheduler.schedule(gameCode, 'expire', game.creationTime + LOBBY_TIMEOUT)
+            game.park()
+        elif game.gameOver:
+            finishedGames.add(gameCode)
+            scheduler.schedule(gameCode, 'archive', archive_deadline(game))
+        else:
+            schedule_tick(gameCode, game)
+
+    journal = restored
+    journal.start(snapshot_records)
+    return len(activeGames), replayed, time.perf_counter() - start
+
+def open_archive(path):
+    """Keep finished games' results in the SQLite file at path once they are evicted"""
+    global archive
+    archive = Archive(path)
+
+def close_archive():
+    """Close the archive, e.g. before the process exits"""
+    global archive
+    if archive is not None:
+        archive.close()
+        archive = None
+
+def close_journal():
+    """Flush and stop the journal, e.g. before the process exits"""
+    global journal
+    if journal is not None:
+        journal.close()
+        journal = None
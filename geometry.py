@@ -0,0 +1,135 @@
+import os, hashlib, logging, tempfile, threading
+import numpy as np
+from board import Board
+
+# Board configuration that matches the frontend structure
+# We'll use flat arrays to match the frontend structure
+# null values represent non-playable spaces
+BOARD_CONFIG = [
+    None, 0, 0, 0, 0, None, None,
+    None, 0, 0, 0, 0, 0, None,
+    0, 0, 0, 0, 0, 0, None,
+    0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, None,
+    None, 0, 0, 0, 0, 0, None,
+    None, 0, 0, 0, 0, None, None
+]
+
+# Neighbour offsets (dcol, drow); odd columns sit half a cell above even ones
+DIRECTIONS = {
+    0: [(0, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0)],
+    1: [(0, -1), (1, -1), (1, 0), (0, 1), (-1, 0), (-1, -1)]
+}
+
+# Compiled adjacency is cached here so startup doesn't recompute large boards
+CACHE_DIR = os.environ.get(
+    'GEOMETRY_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.geometry_cache')
+)
+
+def hexagon(radius):
+    """Shape description of a hexagonal board with the given radius"""
+    size = 2 * radius + 1
+    config = []
+    for col in range(size):
+        for row in range(size):
+            # Convert offset coordinates to axial ones relative to the centre cell
+            q = col - radius
+            r = row - (col + (col & 1)) // 2 - (radius - (radius + (radius & 1)) // 2)
+            config.append(0 if max(abs(q), abs(r), abs(q + r)) <= radius else None)
+    return size, config
+
+def rectangle(width, height):
+    """Shape description of a fully playable width x height board"""
+    return width, [0] * (width * height)
+
+# Named map layouts as (column count, flat column-major config)
+LAYOUTS = {
+    'classic': (7, BOARD_CONFIG),
+    'hexagon': hexagon(12),
+    'continent': rectangle(64, 64)
+}
+
+DEFAULT_LAYOUT = 'classic'
+
+class Geometry:
+    """Compiled coordinates and adjacency for one board layout"""
+
+    def __init__(self, layout_id, width, config, adjacency=None):
+        self.id = layout_id
+        self.width = width
+        self.height = len(config) // width
+        self.config = config
+        self.size = len(config)
+
+        # Map flat index to 2D coordinates; cell idx lives at column idx // height
+        self.coordinates = {
+            idx: divmod(idx, self.height) for idx, cell in enumerate(config) if cell is not None
+        }
+
+        if adjacency is None:
+            adjacency = self._compile_adjacency()
+        # Fixed-width neighbour index array, padded with `size` for missing neighbours
+        self.adjacency_index = adjacency
+        self.adjacency = {
+            idx: [adj_idx for adj_idx in adjacency[idx].tolist() if adj_idx != self.size]
+            for idx in self.coordinates
+        }
+        # Neighbour bitmask per cell, for adjacency checks against board ownership masks
+        self.adjacency_masks = [0] * self.size
+        for idx, neighbours in self.adjacency.items():
+            for adj_idx in neighbours:
+                self.adjacency_masks[idx] |= 1 << adj_idx
+
+        # Template every new game board on this layout is copied from
+        self.empty_board = Board.from_config(
+            config, tuple(tuple(self.adjacency.get(idx, ())) for idx in range(self.size)))
+
+    def _compile_adjacency(self):
+        """Build the neighbour index array in one pass over the cells"""
+        adjacency = np.full((self.size, 6), self.size, dtype=np.intp)
+        for idx, (col, row) in self.coordinates.items():
+            slot = 0
+            for dx, dy in DIRECTIONS[col % 2]:
+                new_col, new_row = col + dx, row + dy
+                if 0 <= new_col < self.width and 0 <= new_row < self.height:
+                    adj_idx = new_col * self.height + new_row
+                    if self.config[adj_idx] is not None:
+                        adjacency[idx, slot] = adj_idx
+                        slot += 1
+        return adjacency
+
+_geometries = {}
+_lock = threading.Lock()
+
+def get_geometry(layout_id=DEFAULT_LAYOUT):
+    """Return the compiled geometry for a layout id, compiling it on first use"""
+    geometry = _geometries.get(layout_id)
+    if geometry is not None:
+        return geometry
+
+    with _lock:
+        if layout_id not in _geometries:
+            width, config = LAYOUTS[layout_id]
+            _geometries[layout_id] = _load(layout_id, width, config)
+        return _geometries[layout_id]
+
+def _load(layout_id, width, config):
+    # The file name carries a fingerprint of the shape so edited layouts don't reuse stale caches
+    digest = hashlib.sha1(repr((width, config)).encode()).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, '%s-%s.npy' % (layout_id, digest))
+    if os.path.exists(path):
+        try:
+            return Geometry(layout_id, width, config, np.load(path).astype(np.intp))
+        except (OSError, ValueError):
+            logging.warning('Ignoring unreadable geometry cache %s', path)
+
+    geometry = Geometry(layout_id, width, config)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, geometry.adjacency_index.astype(np.int32))
+        os.replace(tmp_path, path)
+    except OSError:
+        logging.warning('Could not write geometry cache %s', path)
+    return geometry
@@ -0,0 +1,233 @@
+import os, json, time, logging, threading
+import metrics
+
+# Where the server keeps its journal; set JOURNAL_DIR to an empty string to run without one
+JOURNAL_DIR = os.environ.get(
+    'JOURNAL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.journal')
+)
+
+JOURNAL_EVENTS = metrics.Counter('journal_events', 'Events appended to the journal')
+FSYNC_DURATION = metrics.Histogram('journal_fsync_duration_seconds', 'Time to write and fsync one batch of events')
+FSYNC_BATCH = metrics.Histogram(
+    'journal_fsync_events', 'Events written per fsync', buckets=(1, 10, 100, 1000, 10000, 100000))
+SNAPSHOT_DURATION = metrics.Histogram(
+    'journal_snapshot_duration_seconds', 'Time to write a snapshot of every game', buckets=(0.01, 0.1, 1, 10, 60))
+
+SEGMENT_FILE = 'journal-%08d.log'
+SNAPSHOT_FILE = 'snapshot-%08d.jsonl'
+
+def _compact(value):
+    return json.dumps(value, separators=(',', ':'))
+
+class Journal:
+    """Append-only event log with batched fsync and periodic snapshots
+
+    Every event is one JSON array line, [seq, kind, gameCode, *fields], with
+    seq increasing across the whole log. append() only buffers the line; a
+    background thread writes and fsyncs the buffer every fsync_interval
+    seconds, so a crash loses at most that window of events. After every
+    snapshot_every events the thread starts a new segment file, writes a
+    snapshot of every game covering the segments before it, then deletes
+    those segments. Events arriving while a snapshot is written wait in the
+    buffer until it is done.
+
+    Snapshots are captured one game at a time while events keep arriving, so
+    a snapshot may already include some events from the segment after it.
+    Replay skips any event whose seq is not newer than the game's recorded
+    journalSeq.
+    """
+
+    def __init__(self, directory, fsync_interval=0.05, snapshot_every=200000):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Condition()
+        self._buffer = []
+        self._seq = 0
+        self._since_snapshot = 0
+        self._closed = False
+        self._capture = None
+        self._thread = None
+        self._file = None
+
+        snapshots = self._numbered('snapshot-', '.jsonl')
+        segments = self._numbered('journal-', '.log')
+        # The latest snapshot covers every segment numbered up to its own number
+        self._snapshot = snapshots[-1] if snapshots else None
+        self._replay_segments = [n for n in segments if self._snapshot is None or n > self._snapshot]
+        # Always write to a fresh segment; an old one may end in a torn line
+        self._segment = max(segments + [self._snapshot or 0]) + 1
+
+    def recover(self):
+        """Return (records, events): the latest snapshot's game records and the events after it
+
+        events is an iterator; consume it before start() so sequence numbers
+        continue from the last event on disk.
+        """
+        records = []
+        if self._snapshot is not None:
+            with open(self._path(SNAPSHOT_FILE, self._snapshot)) as f:
+                header = json.loads(f.readline())
+                self._seq = header['seq']
+                records = [json.loads(line) for line in f]
+        return records, self._events()
+
+    def _events(self):
+        for segment in self._replay_segments:
+            with open(self._path(SEGMENT_FILE, segment)) as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A crash mid-write leaves a partial last line; nothing after it was fsynced
+                        logging.warning('Ignoring torn journal line in segment %d', segment)
+                        break
+                    self._seq = max(self._seq, event[0])
+                    yield event
+
+    def start(self, capture):
+        """Start writing; capture() returns the game records for a snapshot"""
+        self._capture = capture
+        self._file = open(self._path(SEGMENT_FILE, self._segment), 'a')
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, kind, gameCode, *fields):
+        """Buffer one event and return its sequence number"""
+        with self._lock:
+            self._seq += 1
+            self._buffer.append(_compact([self._seq, kind, gameCode, *fields]))
+            self._since_snapshot += 1
+            return self._seq
+
+    def last_seq(self):
+        return self._seq
+
+    def position(self):
+        """(segment being written, last seq), for resume() after a restart"""
+        with self._lock:
+            return self._segment, self._seq
+
+    def resume(self, segment, seq):
+        """Continue from games restored some other way as of position() (segment, seq), instead of recover()
+
+        Returns False, changing nothing, if anything was journaled after that
+        position: a later segment, or an event in that segment past seq.
+        Otherwise the first thing start() writes is a snapshot of the
+        restored games, which then replaces the older log.
+        """
+        if self._segment != segment + 1 or self._last_seq(segment) > seq:
+            return False
+        self._seq = seq
+        self._since_snapshot = self.snapshot_every
+        return True
+
+    def close(self):
+        """Flush everything buffered and stop the writer thread"""
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._lock.wait(self.fsync_interval)
+                lines, self._buffer = self._buffer, []
+                closing = self._closed
+                covered = None
+                if self._since_snapshot >= self.snapshot_every and not closing:
+                    # Later events go to the next segment; this one is covered by the snapshot
+                    covered, seq = self._segment, self._seq
+                    self._segment += 1
+                    self._since_snapshot = 0
+
+            self._write(lines)
+            if covered is not None:
+                self._file.close()
+                self._file = open(self._path(SEGMENT_FILE, self._segment), 'a')
+                self._write_snapshot(covered, seq)
+            if closing:
+                self._file.close()
+                return
+
+    def _write(self, lines):
+        if not lines:
+            return
+        start = time.perf_counter()
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        FSYNC_DURATION.observe(time.perf_counter() - start)
+        FSYNC_BATCH.observe(len(lines))
+        JOURNAL_EVENTS.inc(len(lines))
+
+    def _write_snapshot(self, covered, seq):
+        start = time.perf_counter()
+        path = self._path(SNAPSHOT_FILE, covered)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(_compact({'segment': covered, 'seq': seq}) + '\n')
+            for record in self._capture():
+                f.write(_compact(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._fsync_directory()
+
+        # The snapshot replaces every older snapshot and segment
+        for number in self._numbered('snapshot-', '.jsonl'):
+            if number < covered:
+                os.remove(self._path(SNAPSHOT_FILE, number))
+        for number in self._numbered('journal-', '.log'):
+            if number <= covered:
+                os.remove(self._path(SEGMENT_FILE, number))
+        SNAPSHOT_DURATION.observe(time.perf_counter() - start)
+
+    def _last_seq(self, segment, block=65536):
+        """Seq of the last complete event in a segment file, or 0 if it has none, reading back from its end"""
+        try:
+            f = open(self._path(SEGMENT_FILE, segment), 'rb')
+        except FileNotFoundError:
+            return 0
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            tail = b''
+            while end > 0:
+                start = max(0, end - block)
+                f.seek(start)
+                tail = f.read(end - start) + tail
+                end = start
+                # The first piece may be the end of a line that began further back; a torn
+                # last line from a crash doesn't parse and is passed over
+                lines = tail.split(b'\n')
+                for line in reversed(lines if start == 0 else lines[1:]):
+                    try:
+                        return json.loads(line)[0]
+                    except ValueError:
+                        continue
+        return 0
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _numbered(self, prefix, suffix):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(suffix):
+                try:
+                    numbers.append(int(name[len(prefix):-len(suffix)]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    def _path(self, pattern, number):
+        return os.path.join(self.directory, pattern % number)
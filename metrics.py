@@ -0,0 +1,165 @@
+import bisect, threading
+
+# Latency buckets in seconds, from sub-millisecond to multi-second
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Every metric created through this module, in registration order
+REGISTRY = []
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples, or None if there are none; for offline reports"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+def _escape(value):
+    # The text format escapes backslashes first, so the ones added for newlines and quotes stay single
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.label_names:
+            self.labels()  # Unlabelled metrics report zero before their first update
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """Child metric for one combination of label values"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+class _Value:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def values(self):
+        """Current value per combination of label values"""
+        return {values: child.value for values, child in list(self._children.items())}
+
+    def _render_child(self, values, child):
+        return ['%s%s %s' % (self.name, _format_labels(self.label_names, values), _format_value(child.value))]
+
+class Gauge(Counter):
+    """Value that can go up and down, or be computed at scrape time with set_function"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._function = None
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        """Compute the value(s) when scraped; function returns a number or {label values: number}"""
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            result = self._function()
+            if not isinstance(result, dict):
+                result = {(): result}
+            for values, value in result.items():
+                self.labels(*values).set(value)
+        return super().render()
+
+class _Buckets:
+    __slots__ = ('counts', 'sum', 'lock')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _Buckets(len(self.buckets) + 1)
+
+    def observe(self, value, *label_values):
+        child = self.labels(*label_values)
+        slot = bisect.bisect_left(self.buckets, value)
+        with child.lock:
+            child.counts[slot] += 1
+            child.sum += value
+
+    def _render_child(self, values, child):
+        with child.lock:
+            counts, total = list(child.counts), child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else _format_value(bound)
+            lines.append('%s_bucket%s %d' % (self.name, _format_labels(self.label_names, values, [('le', le)]), cumulative))
+        lines.append('%s_sum%s %s' % (self.name, _format_labels(self.label_names, values), repr(total)))
+        lines.append('%s_count%s %d' % (self.name, _format_labels(self.label_names, values), cumulative))
+        return lines
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -12,6 +12,29 @@ type PendingMove = {
   type: MoveType;
 } | null;
 
+// Cells that changed in a game_update, as [index, value] pairs
+type CellChange = [number, number];
+
+// Full game state sent on join and in reply to request_snapshot
+type GameSnapshot = {
+  board: HexValue[];
+  version: number;
+  nextUpdateTime: number;
+  pendingMoves?: {
+    host: PendingMove;
+    player: PendingMove;
+  };
+  gameOver?: boolean;
+  winner?: PlayerType | null;
+};
+
+// Cells each side can claim or defend, from request_legal_moves
+type LegalMoves = {
+  version: number;
+  host: Record<MoveType, number[]>;
+  player: Record<MoveType, number[]>;
+};
+
 type GameState = {
   board: HexValue[];
   nextUpdateTime: number;
@@ -154,6 +177,10 @@ const HexGrid: React.FC<HexGridProps> = ({ gameCode, playerId, playerType }) =>
   
   const socketRef = useRef<Socket | null>(null);
   const timerRef = useRef<NodeJS.Timeout | null>(null);
+  // Board version we last applied; -1 until the first full snapshot arrives
+  const versionRef = useRef<number>(-1);
+  // Our side's legal cells for the current board version, so rejected moves aren't sent
+  const legalMovesRef = useRef<Record<MoveType, Set<number>> | null>(null);
   
   // Connect to WebSocket and initialize game
   useEffect(() => {
@@ -168,10 +195,11 @@ const HexGrid: React.FC<HexGridProps> = ({ gameCode, playerId, playerType }) =>
       socket.emit('join_game', { gameCode });
     });
 
-    socket.on('joined', (data) => {
-      console.log('Joined game room:', data);
-      // Initialize game state with data from server
+    // Full snapshots replace the board and reset the version we apply deltas on top of
+    const applySnapshot = (data: GameSnapshot) => {
       if (data && data.board) {
+        versionRef.current = data.version;
+        socket.emit('request_legal_moves', { gameCode });
         setGameState(prev => ({
           ...prev,
           board: data.board,
@@ -181,6 +209,26 @@ const HexGrid: React.FC<HexGridProps> = ({ gameCode, playerId, playerType }) =>
           winner: data.winner || null
         }));
       }
+    };
+
+    socket.on('joined', (data) => {
+      console.log('Joined game room:', data);
+      // Initialize game state with data from server
+      applySnapshot(data);
+    });
+
+    socket.on('game_snapshot', (data) => {
+      console.log('Game snapshot received:', data);
+      applySnapshot(data);
+    });
+
+    socket.on('legal_moves', (data: LegalMoves) => {
+      // Ignore replies for a board we have already moved past
+      if (data.version !== versionRef.current) return;
+      legalMovesRef.current = {
+        claim: new Set(data[playerType].claim),
+        defend: new Set(data[playerType].defend)
+      };
     });
 
     socket.on('move_preview', (data) => {
@@ -197,17 +245,32 @@ const HexGrid: React.FC<HexGridProps> = ({ gameCode, playerId, playerType }) =>
 
     socket.on('game_update', (data) => {
       console.log('Game update received:', data);
-      // Update the game state with the new board
-      if (data && data.board) {
-        setGameState(prev => ({
+      if (!data) return;
+
+      // Ask for a full snapshot if we missed an update
+      if (data.version !== versionRef.current + 1) {
+        socket.emit('request_snapshot', { gameCode });
+        return;
+      }
+      versionRef.current = data.version;
+      legalMovesRef.current = null;
+      socket.emit('request_legal_moves', { gameCode });
+
+      // Apply only the cells that changed since the previous update
+      setGameState(prev => {
+        const board = [...prev.board];
+        data.changes.forEach(([index, value]: CellChange) => {
+          board[index] = value;
+        });
+        return {
           ...prev,
-          board: data.board,
+          board,
           nextUpdateTime: data.nextUpdateTime * 1000, // Convert to milliseconds
           pendingMoves: data.pendingMoves || { host: null, player: null },
           gameOver: data.gameOver || false,
           winner: data.winner || null
-        }));
-      }
+        };
+      });
     });
 
     socket.on('game_timeout', (data) => {
@@ -230,7 +293,7 @@ const HexGrid: React.FC<HexGridProps> = ({ gameCode, playerId, playerType }) =>
         socket.disconnect();
       }
     };
-  }, [gameCode]);
+  }, [gameCode, playerType]);
 
   // Start a countdown timer for the next move
   useEffect(() => {
@@ -270,6 +333,12 @@ const HexGrid: React.FC<HexGridProps> = ({ gameCode, playerId, playerType }) =>
     
     // Handle the click based on button type
     const moveType: MoveType = button === "right" ? "defend" : "claim";
+
+    // Skip moves the server would reject
+    if (legalMovesRef.current && !legalMovesRef.current[moveType].has(index)) {
+      console.log(`Cell ${index} cannot be used for ${moveType} right now`);
+      return;
+    }
     
     try {
       // Send move to server
@@ -0,0 +1,109 @@
+"""Re-simulate journaled games and check they end on the boards the server recorded
+
+Reads a journal directory, rebuilds each game from its create event (or the
+latest snapshot), applies the recorded joins and moves and resolves every tick
+again with process_moves and the game's seed, without any server, timers or
+sockets. After every tick the simulated board is compared with the board
+built from the changes the server recorded, and a game passes only if the
+two never differ:
+
+    python replay.py .journal
+    python replay.py .journal --game ABCD  # one game, reporting the first tick that diverges
+"""
+import os, sys, time, argparse
+import games
+from journal import Journal, JOURNAL_DIR
+from state import encode_move
+
+class Replay:
+    """One game being re-simulated alongside the board the server recorded for it"""
+
+    def __init__(self, game, board):
+        self.game = game
+        self.recorded = board
+        self.ticks = 0
+        self.diverged = None  # Version of the first tick whose changes differed
+
+    def tick(self, version, changes):
+        game = self.game
+        games.process_moves(game)
+        game.board.take_changes()
+        for idx, value in changes:
+            self.recorded[idx] = value
+        self.recorded.take_changes()
+        if self.diverged is None and game.board.cells != self.recorded.cells:
+            self.diverged = version
+        game.version = version
+        self.ticks += 1
+
+    def matches(self):
+        return self.diverged is None and self.game.board.cells == self.recorded.cells
+
+def start(game):
+    recorded = game.board.copy()
+    recorded.take_changes()
+    return Replay(game, recorded)
+
+def replay_journal(directory, only=None):
+    """Re-simulate every game in a journal; returns ([(gameCode, Replay)], events read, seconds)"""
+    started = time.perf_counter()
+    records, events = Journal(directory).recover()
+    live, finished = {}, []
+    for saved in records:
+        if only is None or saved['gameCode'] == only:
+            live[saved['gameCode']] = start(games.restore_game(saved))
+
+    count = 0
+    for event in events:
+        count += 1
+        seq, kind, gameCode = event[:3]
+        if only is not None and gameCode != only:
+            continue
+        replay = live.get(gameCode)
+        if replay is not None and replay.game.journalSeq >= seq:
+            continue  # Already in the snapshot
+
+        if kind == 'create':
+            hostId, playerId, layout, creationTime, seed, host_pos, player_pos, tickPolicy, tickInterval = event[3:]
+            board = games.get_geometry(layout).empty_board.copy()
+            if games.place_fortresses(board, seed) != (host_pos, player_pos):
+                raise ValueError('Game %s: fortresses do not follow from its seed' % gameCode)
+            board.take_changes()
+            game = games.new_game(hostId, playerId, layout, board, creationTime, seed, tickPolicy, tickInterval)
+            replay = live[gameCode] = start(game)
+        elif replay is None:
+            continue  # Created before the snapshot and gone by the time it was taken
+        elif kind == 'move':
+            playerType, index, moveType = event[3:]
+            setattr(replay.game, 'hostMove' if playerType == 'host' else 'playerMove', encode_move(index, moveType))
+        elif kind == 'tick':
+            replay.tick(event[3], event[5])
+        elif kind == 'remove':
+            finished.append((gameCode, live.pop(gameCode)))
+        replay.game.journalSeq = seq
+
+    finished.extend(live.items())
+    return finished, count, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', nargs='?', default=JOURNAL_DIR, help='journal directory (default: %(default)s)')
+    parser.add_argument('--game', help='only replay this game code')
+    args = parser.parse_args()
+    if not os.path.isdir(args.directory):
+        parser.error('no journal at %s' % args.directory)
+
+    replays, events, seconds = replay_journal(args.directory, args.game)
+    ticks = sum(replay.ticks for _, replay in replays)
+    mismatched = [(code, replay) for code, replay in replays if not replay.matches()]
+    print('%d games  %d ticks  %d events in %.2f s (%.0f events/s)' % (
+        len(replays), ticks, events, seconds, events / seconds if seconds else 0))
+    for gameCode, replay in mismatched[:20]:
+        print('  %s diverged at version %s' % (gameCode, replay.diverged))
+    if mismatched:
+        print('FAIL: %d of %d games ended on a different board' % (len(mismatched), len(replays)))
+        sys.exit(1)
+    print('OK: every final board matches')
+
+if __name__ == '__main__':
+    main()
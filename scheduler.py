@@ -0,0 +1,119 @@
+import heapq, itertools, threading, time
+
+class GameScheduler:
+    """Min-heap of game deadlines so the game loop only wakes for games that are due"""
+
+    def __init__(self):
+        self._heap = []          # (deadline, seq, gameCode, kind)
+        self._deadlines = {}     # gameCode -> {kind: current deadline}
+        self._counter = itertools.count()
+        self._wakeup = threading.Condition()
+        self._listeners = []     # callables run when an earlier deadline is scheduled
+
+    def __len__(self):
+        with self._wakeup:
+            return sum(len(kinds) for kinds in self._deadlines.values())
+
+    def schedule(self, gameCode, kind, deadline):
+        """Set (or move) the deadline of a game event, replacing any earlier entry"""
+        with self._wakeup:
+            self._deadlines.setdefault(gameCode, {})[kind] = deadline
+            entry = (deadline, next(self._counter), gameCode, kind)
+            heapq.heappush(self._heap, entry)
+            self._compact()
+            # Only wake the loop if this entry is now the earliest deadline
+            if self._heap[0][0] == deadline:
+                self._wakeup.notify_all()
+                for listener in self._listeners:
+                    listener()
+
+    def schedule_many(self, events):
+        """schedule() every (gameCode, kind, deadline) at once, heapifying once instead of per event"""
+        events = list(events)
+        with self._wakeup:
+            fresh = {gameCode: {kind: deadline} for gameCode, kind, deadline in events}
+            # A batch of one event per new game, as a restore schedules, skips merging kinds one by one
+            if len(fresh) == len(events) and self._deadlines.keys().isdisjoint(fresh):
+                self._deadlines.update(fresh)
+            else:
+                for gameCode, kind, deadline in events:
+                    self._deadlines.setdefault(gameCode, {})[kind] = deadline
+            self._heap.extend([(deadline, seq, gameCode, kind)
+                               for (gameCode, kind, deadline), seq in zip(events, self._counter)])
+            heapq.heapify(self._heap)
+            self._compact()
+            self._wakeup.notify_all()
+            for listener in self._listeners:
+                listener()
+
+    def add_listener(self, callback):
+        """Also call callback() on early wakeups, for event loops that can't block in wait()"""
+        with self._wakeup:
+            self._listeners.append(callback)
+
+    def cancel(self, gameCode, kind=None):
+        """Drop pending events for a game; stale heap entries are skipped lazily"""
+        with self._wakeup:
+            if kind is None:
+                self._deadlines.pop(gameCode, None)
+                return
+            kinds = self._deadlines.get(gameCode)
+            if kinds is not None:
+                kinds.pop(kind, None)
+                if not kinds:
+                    del self._deadlines[gameCode]
+
+    def next_deadline(self):
+        """Return the earliest live deadline, or None when nothing is scheduled"""
+        with self._wakeup:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return (gameCode, kind) for every event whose deadline has passed"""
+        due = []
+        with self._wakeup:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, gameCode, kind = heapq.heappop(self._heap)
+                if self._is_live(deadline, gameCode, kind):
+                    kinds = self._deadlines[gameCode]
+                    del kinds[kind]
+                    if not kinds:
+                        del self._deadlines[gameCode]
+                    due.append((gameCode, kind))
+        return due
+
+    def wait(self, max_wait=None):
+        """Sleep until the earliest deadline passes or an earlier one is scheduled"""
+        with self._wakeup:
+            self._discard_stale()
+            if self._heap:
+                timeout = self._heap[0][0] - time.time()
+                if max_wait is not None:
+                    timeout = min(timeout, max_wait)
+                if timeout > 0:
+                    self._wakeup.wait(timeout)
+            else:
+                self._wakeup.wait(max_wait)
+
+    def _discard_stale(self):
+        # Pop cancelled or rescheduled entries sitting at the top of the heap
+        while self._heap:
+            deadline, _, gameCode, kind = self._heap[0]
+            if self._is_live(deadline, gameCode, kind):
+                break
+            heapq.heappop(self._heap)
+
+    def _is_live(self, deadline, gameCode, kind):
+        return self._deadlines.get(gameCode, {}).get(kind) == deadline
+
+    def _compact(self):
+        # Rebuild once stale entries dominate so cancelled lobbies don't pile up
+        if len(self._heap) > 4 * len(self._deadlines) + 64:
+            live = {}
+            for entry in self._heap:
+                deadline, _, gameCode, kind = entry
+                if self._is_live(deadline, gameCode, kind):
+                    live[(gameCode, kind)] = entry
+            self._heap = list(live.values())
+            heapq.heapify(self._heap)
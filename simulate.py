@@ -0,0 +1,226 @@
+"""Headless self-play for balance testing
+
+Plays games between two agents with the server's own rules: moves are
+checked with games.is_legal_move, rounds are resolved with
+games.process_moves, won by games.check_win_condition and timed out for
+inactivity by games.track_inactivity at --tick-seconds per round. Nothing
+waits for timers or touches Flask or sockets; each round is one call. Games
+are spread over a process pool and every game is reproducible from --seed:
+
+    python simulate.py --games 100000
+    python simulate.py --host-agent expand --player-agent aggressive --neutralize-chance 0.4
+    python simulate.py --host-agent mybots:cautious  # any module:function agent
+
+An agent is a function agent(board, symbol, rng) returning (index, moveType)
+or None to pass, where symbol is 1 for the host and -1 for the player and rng
+is a random.Random for the agent's own choices. Illegal moves are dropped and
+counted, as the server would reject them. Both seats default to the
+aggressive agent: random and expanding agents almost never finish a game
+within --max-rounds, which leaves win rates with nothing to measure.
+
+The host's move is resolved before the player's every round, so the host
+seat is the first mover. When the two agents differ, half the games are
+played with their seats swapped, so agent strength and seat advantage can be
+told apart.
+"""
+import time, random, argparse, importlib, collections, multiprocessing
+import games
+from board import iter_bits
+from metrics import percentile
+from geometry import LAYOUTS, DEFAULT_LAYOUT
+from state import encode_move, starting_board
+
+# Rounds after which an undecided game counts as a draw
+MAX_ROUNDS = 500
+
+def random_agent(board, symbol, rng):
+    """Any legal move, uniformly"""
+    moves = [(idx, 'claim') for idx in iter_bits(board.claimable(symbol))]
+    moves += [(idx, 'defend') for idx in iter_bits(board.owned(symbol))]
+    return rng.choice(moves) if moves else None
+
+def expand_agent(board, symbol, rng):
+    """Claim whenever possible, otherwise defend"""
+    claims = list(iter_bits(board.claimable(symbol)))
+    if claims:
+        return rng.choice(claims), 'claim'
+    owned = list(iter_bits(board.owned(symbol)))
+    return (rng.choice(owned), 'defend') if owned else None
+
+def defensive_agent(board, symbol, rng):
+    """Reinforce weak cells on the front line, otherwise expand"""
+    enemy_near = board.player_near if symbol > 0 else board.host_near
+    weak = [idx for idx in iter_bits(board.owned(symbol))
+            if enemy_near[idx] and abs(board.cells[idx]) < games.DEFENSE_CAP]
+    if weak:
+        return rng.choice(weak), 'defend'
+    return expand_agent(board, symbol, rng)
+
+def aggressive_agent(board, symbol, rng):
+    """Claim next to enemy cells to roll for neutralizing them, otherwise expand"""
+    claims = board.claimable(symbol)
+    contested = claims & (board.host_frontier if symbol < 0 else board.player_frontier)
+    if contested:
+        return rng.choice(list(iter_bits(contested))), 'claim'
+    return expand_agent(board, symbol, rng)
+
+AGENTS = {
+    'random': random_agent,
+    'expand': expand_agent,
+    'defensive': defensive_agent,
+    'aggressive': aggressive_agent
+}
+
+def load_agent(name):
+    """A built-in agent by name, or module:function for a scripted one"""
+    if name in AGENTS:
+        return AGENTS[name]
+    module, _, function = name.partition(':')
+    if not function:
+        raise ValueError('Unknown agent %r; use one of %s or module:function' % (name, ', '.join(AGENTS)))
+    return getattr(importlib.import_module(module), function)
+
+def play(layout, seed, host_agent, player_agent, max_rounds, tick_seconds):
+    """Play one game; returns (winner or None for a draw, rounds played, illegal moves)"""
+    board = starting_board(layout, seed)
+    game = games.new_game(None, None, layout, board, 0, seed, tickInterval=tick_seconds)
+    agent_rng = random.Random(~seed)
+    illegal = 0
+
+    for rounds in range(1, max_rounds + 1):
+        # Both sides choose from the same board, as clients do between ticks
+        for agent, symbol, move_key in ((host_agent, 1, 'hostMove'), (player_agent, -1, 'playerMove')):
+            move = agent(board, symbol, agent_rng)
+            if move is None:
+                continue
+            index, moveType = move
+            if games.is_legal_move(board, symbol, index, moveType):
+                setattr(game, move_key, encode_move(index, moveType))
+            else:
+                illegal += 1
+
+        moves_made = games.process_moves(game)
+        board.take_changes()
+        game.version += 1
+        winner = games.check_win_condition(board)
+        if winner:
+            return winner, rounds, illegal
+        # Rounds without a move end the game only once the server would time it out
+        if games.track_inactivity(game, moves_made):
+            return None, rounds, illegal
+    return None, max_rounds, illegal
+
+def configure(rules):
+    """Apply rule overrides in this process (pool workers get a copy of the module)"""
+    games.DEFENSE_CAP = rules['defenseCap']
+    games.NEUTRALIZE_CHANCE = rules['neutralizeChance']
+
+def play_chunk(job):
+    """Play a run of consecutive seeds; returns one (seed, swapped, winner, rounds, illegal) per game"""
+    rules, layout, names, first_seed, count, swap, max_rounds, tick_seconds = job
+    configure(rules)
+    agents = [load_agent(name) for name in names]
+    results = []
+    for seed in range(first_seed, first_seed + count):
+        swapped = swap and seed % 2 == 1
+        host, player = (agents[1], agents[0]) if swapped else agents
+        winner, rounds, illegal = play(layout, seed, host, player, max_rounds, tick_seconds)
+        results.append((seed, swapped, winner, rounds, illegal))
+    return results
+
+def summarize(results, names, tick_seconds):
+    """Win rates by agent and seat, first-mover advantage and the game-length distribution"""
+    total = len(results)
+    seat_wins = collections.Counter(winner or 'draw' for _, _, winner, _, _ in results)
+    agent_wins = collections.Counter()
+    for _, swapped, winner, _, _ in results:
+        if winner:
+            # Agent 0 plays host unless the seats were swapped
+            agent_wins[names[(winner == 'player') != swapped]] += 1
+    lengths = [rounds for _, _, _, rounds, _ in results]
+
+    # First-mover advantage: host win rate minus player win rate, with a 95% interval
+    host, player = seat_wins['host'] / total, seat_wins['player'] / total
+    spread = 1.96 * ((host + player - (host - player) ** 2) / total) ** 0.5
+
+    return {
+        'games': total,
+        'wins': {'host': seat_wins['host'], 'player': seat_wins['player'], 'draw': seat_wins['draw']},
+        'agentWins': dict(agent_wins),
+        'firstMoverAdvantage': host - player,
+        'firstMoverInterval': spread,
+        'illegalMoves': sum(illegal for _, _, _, _, illegal in results),
+        'rounds': {pct: percentile(lengths, pct) for pct in (10, 25, 50, 75, 90, 99)},
+        'meanRounds': sum(lengths) / total,
+        'maxRounds': max(lengths),
+        'tickSeconds': tick_seconds
+    }
+
+def print_report(summary, names, elapsed, histogram):
+    total = summary['games']
+    print('%d games in %.1f s (%.0f games/s)' % (total, elapsed, total / elapsed))
+    wins = summary['wins']
+    print('seat   host %5.1f%%  player %5.1f%%  draw %5.1f%%' % (
+        100 * wins['host'] / total, 100 * wins['player'] / total, 100 * wins['draw'] / total))
+    if names[0] != names[1]:
+        print('agent  ' + '  '.join('%s %5.1f%%' % (name, 100 * summary['agentWins'].get(name, 0) / total)
+                                   for name in names))
+    print('first-mover advantage %+.2f%% +/- %.2f%% (host win rate minus player win rate)' % (
+        100 * summary['firstMoverAdvantage'], 100 * summary['firstMoverInterval']))
+    rounds = summary['rounds']
+    print('rounds  mean %.1f  p10 %d  p25 %d  p50 %d  p75 %d  p90 %d  p99 %d  max %d' % (
+        summary['meanRounds'], rounds[10], rounds[25], rounds[50], rounds[75], rounds[90], rounds[99],
+        summary['maxRounds']))
+    print('median game %.0f s at %g s per tick' % (rounds[50] * summary['tickSeconds'], summary['tickSeconds']))
+    if summary['illegalMoves']:
+        print('illegal moves dropped: %d' % summary['illegalMoves'])
+
+    # Game lengths in buckets of 10 rounds
+    width = max(histogram.values())
+    for bucket in sorted(histogram):
+        count = histogram[bucket]
+        print('  %4d-%-4d %7d %s' % (bucket, bucket + 9, count, '#' * max(1, round(40 * count / width))))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=10000, help='games to play')
+    parser.add_argument('--host-agent', default='aggressive', help='agent for the host seat: %s or module:function'
+                        % ', '.join(AGENTS))
+    parser.add_argument('--player-agent', default='aggressive', help='agent for the player seat')
+    parser.add_argument('--layout', default=DEFAULT_LAYOUT, choices=sorted(LAYOUTS))
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game; game i uses seed + i')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='processes to play in')
+    parser.add_argument('--chunk', type=int, default=500, help='games handed to a worker at a time')
+    parser.add_argument('--max-rounds', type=int, default=MAX_ROUNDS, help='rounds before a game is a draw')
+    parser.add_argument('--no-swap', action='store_true', help='keep each agent in its seat for every game')
+    parser.add_argument('--defense-cap', type=int, default=games.DEFENSE_CAP, help='highest cell strength')
+    parser.add_argument('--neutralize-chance', type=float, default=games.NEUTRALIZE_CHANCE,
+                        help='chance a claim neutralizes each adjacent strength-1 enemy cell')
+    parser.add_argument('--tick-seconds', type=float, default=games.TICK_INTERVAL,
+                        help='round length, for the inactivity timeout and reporting game length')
+    args = parser.parse_args()
+
+    names = [args.host_agent, args.player_agent]
+    for name in names:
+        load_agent(name)  # Fail here rather than in every worker
+    rules = {'defenseCap': args.defense_cap, 'neutralizeChance': args.neutralize_chance}
+    swap = not args.no_swap and names[0] != names[1]
+    jobs = [(rules, args.layout, names, args.seed + start, min(args.chunk, args.games - start), swap, args.max_rounds,
+             args.tick_seconds) for start in range(0, args.games, args.chunk)]
+
+    start = time.perf_counter()
+    results = []
+    if args.workers > 1:
+        with multiprocessing.Pool(args.workers) as pool:
+            for chunk in pool.imap_unordered(play_chunk, jobs):
+                results.extend(chunk)
+    else:
+        for job in jobs:
+            results.extend(play_chunk(job))
+    elapsed = time.perf_counter() - start
+
+    histogram = collections.Counter(rounds // 10 * 10 for _, _, _, rounds, _ in results)
+    print_report(summarize(results, names, args.tick_seconds), names, elapsed, histogram)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import zlib, random, struct
+from array import array
+from collections import namedtuple
+from board import Board, iter_bits
+from geometry import get_geometry
+
+# Pending moves are packed into one small int: the cell index shifted left, with
+# the low bit set for a defend. None means no move is queued.
+MOVE_TYPES = ('claim', 'defend')
+
+def encode_move(index, moveType):
+    """Pack a validated move into its int form"""
+    return index << 1 | MOVE_TYPES.index(moveType)
+
+def decode_move(move):
+    """The {'index', 'type'} form of a packed move sent to clients, or None"""
+    if move is None:
+        return None
+    return {'index': move >> 1, 'type': MOVE_TYPES[move & 1]}
+
+def place_fortresses(board, seed):
+    """Place the host (1) and player (-1) fortresses on random valid cells chosen by seed"""
+    host_pos, player_pos = random.Random(seed).sample(list(iter_bits(board.valid)), 2)
+    board[host_pos] = 1
+    board[player_pos] = -1
+    return host_pos, player_pos
+
+def starting_board(layout, seed):
+    """The board a game with this seed starts on, with no pending changes"""
+    board = get_geometry(layout).empty_board.copy()
+    place_fortresses(board, seed)
+    board.take_changes()
+    return board
+
+# A hibernated game: this header, then its host id, player id and layout joined by
+# NUL, then its zlib-compressed cells unless the board is still the starting one
+# (raw cells with FROZEN_RAW). Times, seed, stateVersion, journalSeq, version,
+# timeout, moves + 1 (0 for none), flags (FROZEN_*) and the length of the names.
+_frozen = struct.Struct('<dddddQQQIIHHBH')
+FROZEN_OVER, FROZEN_HOST_WON, FROZEN_PLAYER_WON, FROZEN_EARLY, FROZEN_RAW = 1, 2, 4, 8, 16
+
+# The leading header fields: creationTime, startTime, nextUpdateTime and tickInterval
+_frozen_clocks = struct.Struct('<dddd')
+_FROZEN_FLAGS = _frozen.size - 3
+
+# What scheduling a frozen game needs, read without thawing it; the names match GameState
+FrozenClocks = namedtuple('FrozenClocks', 'creationTime startTime nextUpdateTime tickInterval gameOver')
+
+def frozen_clocks(frozen, shift=0.0):
+    """FrozenClocks of a frozen game, without thawing it, moved on by shift seconds as thaw() would"""
+    creationTime, startTime, nextUpdateTime, tickInterval = _frozen_clocks.unpack_from(frozen)
+    return FrozenClocks(creationTime + shift, -1 if startTime == -1 else startTime + shift, nextUpdateTime + shift,
+                        tickInterval, bool(frozen[_FROZEN_FLAGS] & FROZEN_OVER))
+
+def frozen_players(frozen):
+    """(hostId, playerId) of a frozen game, without thawing it"""
+    length = _frozen.unpack_from(frozen)[-1]
+    hostId, playerId, _ = frozen[_frozen.size:_frozen.size + length].decode().split('\0')
+    return hostId, playerId
+
+class GameState:
+    """Everything the server keeps for one game
+
+    Fields are slots rather than dict keys and moves are packed ints. The
+    board of a game that hasn't resolved a round yet can be dropped with
+    park() and is rebuilt from the seed on next access, so a parked lobby is
+    little more than a few numbers, a lock and its two player ids. There is
+    no per-game random generator; games.round_rng() derives one per round.
+    An idle game can go further and be frozen to bytes, then thawed later.
+    """
+    __slots__ = ('creationTime', 'startTime', 'nextUpdateTime', 'tickPolicy', 'tickInterval', 'timeout',
+                 'hostId', 'playerId', 'hostMove', 'playerMove', 'geometry', '_board', 'version',
+                 'stateVersion', 'snapshotCache', 'seed', 'lock', 'journalSeq', 'gameOver', 'winner',
+                 'lastTouched')
+
+    def __init__(self, hostId, playerId, layout, board, creationTime, seed, tickPolicy, tickInterval,
+                 stateVersion, lock):
+        self.creationTime = creationTime
+        self.startTime = -1  # Will be set when second player joins
+        self.nextUpdateTime = creationTime + tickInterval  # First update one interval after creation
+        self.tickPolicy = tickPolicy
+        self.tickInterval = tickInterval
+        self.timeout = 0
+        self.hostId = hostId
+        self.playerId = playerId
+        self.hostMove = None  # Packed with encode_move()
+        self.playerMove = None
+        self.geometry = layout
+        self._board = board  # None until first use for a board still at its starting position
+        self.version = 0  # Bumped on every tick so clients can spot missed deltas
+        self.stateVersion = stateVersion  # Changes whenever the /game/sync response would
+        self.snapshotCache = None  # Encoded snapshots for the current stateVersion
+        self.seed = seed
+        self.lock = lock  # Held by anything reading or writing moves and board together
+        self.journalSeq = 0  # Last journal event applied to this game
+        self.gameOver = False
+        self.winner = None
+        self.lastTouched = creationTime  # Last request for this game, for hibernation
+
+    @property
+    def board(self):
+        board = self._board
+        if board is None:
+            board = self._board = starting_board(self.geometry, self.seed)
+        return board
+
+    def board_list(self):
+        """The board as a list of cell values, without keeping a rebuilt board on a parked game"""
+        board = self._board
+        if board is None:
+            board = starting_board(self.geometry, self.seed)
+        return board.to_list()
+
+    def park(self):
+        """Drop the board while no round has changed it; the next access rebuilds it from the seed"""
+        if self.version == 0:
+            self._board = None
+
+    def freeze(self, compress=True):
+        """The game as compact bytes, without its lock or snapshot cache; thaw() reverses it
+
+        compress=False keeps the cells raw, trading a few dozen bytes for a
+        freeze that is twice as fast.
+        """
+        flags = ((FROZEN_OVER if self.gameOver else 0)
+                 | (FROZEN_HOST_WON if self.winner == 'host' else 0)
+                 | (FROZEN_PLAYER_WON if self.winner == 'player' else 0)
+                 | (FROZEN_EARLY if self.tickPolicy == 'early' else 0)
+                 | (0 if compress else FROZEN_RAW))
+        names = '\0'.join((self.hostId, self.playerId, self.geometry)).encode()
+        parts = [_frozen.pack(self.creationTime, self.startTime, self.nextUpdateTime, self.tickInterval,
+                              self.lastTouched, self.seed, self.stateVersion, self.journalSeq, self.version,
+                              self.timeout, 0 if self.hostMove is None else self.hostMove + 1,
+                              0 if self.playerMove is None else self.playerMove + 1, flags, len(names)),
+                 names]
+        if self.version and self._board is not None:
+            cells = self._board.cells.tobytes()
+            parts.append(zlib.compress(cells) if compress else cells)
+        return b''.join(parts)
+
+    @classmethod
+    def thaw(cls, frozen, lock, shift=0.0):
+        """Rebuild a game from freeze() output, guarded by lock
+
+        shift moves every clock on by that many seconds, e.g. the time a
+        server was down before restoring the game.
+        """
+        (creationTime, startTime, nextUpdateTime, tickInterval, lastTouched, seed, stateVersion, journalSeq,
+         version, timeout, hostMove, playerMove, flags, length) = _frozen.unpack_from(frozen)
+        end = _frozen.size + length
+        hostId, playerId, layout = frozen[_frozen.size:end].decode().split('\0')
+        board = None
+        if end < len(frozen):
+            empty = get_geometry(layout).empty_board
+            cells = frozen[end:] if flags & FROZEN_RAW else zlib.decompress(frozen[end:])
+            board = Board.from_cells(array('b', cells), empty.valid, empty.neighbours)
+
+        # Whole numbers come back as ints, as they were before freezing
+        if tickInterval.is_integer():
+            tickInterval = int(tickInterval)
+        game = cls(hostId, playerId, layout, board, creationTime + shift, seed,
+                   'early' if flags & FROZEN_EARLY else 'fixed', tickInterval, stateVersion, lock)
+        game.startTime = -1 if startTime == -1 else startTime + shift
+        game.nextUpdateTime = nextUpdateTime + shift
+        game.lastTouched = lastTouched + shift
+        game.journalSeq = journalSeq
+        game.version = version
+        game.timeout = timeout
+        game.hostMove = hostMove - 1 if hostMove else None
+        game.playerMove = playerMove - 1 if playerMove else None
+        game.gameOver = bool(flags & FROZEN_OVER)
+        if flags & FROZEN_HOST_WON:
+            game.winner = 'host'
+        elif flags & FROZEN_PLAYER_WON:
+            game.winner = 'player'
+        return game
@@ -0,0 +1,75 @@
+import struct
+from state import MOVE_TYPES as PACKED_MOVE_TYPES
+
+# Compact binary encoding for clients that ask for format 'binary' in join_game.
+# Every message starts with a header:
+#   uint8   message type (SNAPSHOT, DELTA or MOVE_PREVIEW)
+#   uint8   flags (bit 0 game over, bit 1 host won, bit 2 player won)
+#   uint32  state version
+#   float64 nextUpdateTime
+#   2 x (uint16 index, uint8 move type) pending host and player moves
+# followed by a type-specific body:
+#   SNAPSHOT      int8 per cell, NO_CELL for non-playable spaces
+#   DELTA         uint16 count, then count x (uint16 index, int8 value)
+#   MOVE_PREVIEW  nothing; the header carries the new pending moves
+# All integers are little-endian.
+
+SNAPSHOT, DELTA, MOVE_PREVIEW = 1, 2, 3
+
+GAME_OVER, HOST_WON, PLAYER_WON = 1, 2, 4
+
+NO_CELL = -128    # Board value for non-playable spaces
+NO_MOVE = 0xFFFF  # Index of an empty pending-move slot
+MOVE_TYPES = {'claim': 1, 'defend': 2}
+
+FORMATS = ('json', 'binary')
+
+_header = struct.Struct('<BBId')
+_move = struct.Struct('<HB')
+_change = struct.Struct('<Hb')
+
+# Per board shape: NO_CELL bytes at non-playable spaces, OR-ed over the cell buffer
+_outside_masks = {}
+
+def _encode_header(message_type, game):
+    flags = GAME_OVER if game.gameOver else 0
+    if game.winner == 'host':
+        flags |= HOST_WON
+    elif game.winner == 'player':
+        flags |= PLAYER_WON
+    parts = [_header.pack(message_type, flags, game.version, game.nextUpdateTime)]
+    for move in (game.hostMove, game.playerMove):
+        if move is not None:
+            # Packed moves keep the defend flag in the low bit (see state.encode_move)
+            parts.append(_move.pack(move >> 1, MOVE_TYPES[PACKED_MOVE_TYPES[move & 1]]))
+        else:
+            parts.append(_move.pack(NO_MOVE, 0))
+    return b''.join(parts)
+
+def encode_snapshot(game):
+    """Full board and state, the binary counterpart of game_snapshot()"""
+    board = game.board
+    # Spaces outside the map are stored as 0, so OR-ing in NO_CELL marks them
+    cells = int.from_bytes(board.cells.tobytes(), 'little') | _outside_mask(board)
+    return _encode_header(SNAPSHOT, game) + cells.to_bytes(len(board), 'little')
+
+def _outside_mask(board):
+    mask = _outside_masks.get(board.valid)
+    if mask is None:
+        outside = bytes(0 if board.valid >> idx & 1 else NO_CELL & 0xFF for idx in range(len(board)))
+        mask = _outside_masks[board.valid] = int.from_bytes(outside, 'little')
+    return mask
+
+def encode_delta(game, changes):
+    """Changed cells since the previous version, the binary counterpart of game_update"""
+    body = [struct.pack('<H', len(changes))]
+    body.extend(_change.pack(idx, value) for idx, value in changes)
+    return _encode_header(DELTA, game) + b''.join(body)
+
+def encode_move_preview(game):
+    """Pending moves after one side queued a move"""
+    return _encode_header(MOVE_PREVIEW, game)
+
+def binary_room(gameCode):
+    """Socket room for clients receiving the binary encoding of a game"""
+    return gameCode + ':binary'